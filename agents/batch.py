@@ -0,0 +1,279 @@
+# agents/batch.py
+"""
+Modo lote offline (Batch API)
+─────────────────────────────
+Para cargas históricas de miles de artículos, donde no importa la latencia:
+las etapas summarize / extract / classify y los embeddings se envían como
+trabajos por lotes (más baratos y sin límites de ritmo interactivos).
+
+    <BATCH_DIR>/<trabajo>/<etapa>/
+      requests.000.jsonl      ← una petición por línea, con custom_id
+      output.000.jsonl        ← respuestas descargadas
+      state.json              ← ids de fichero/lote de cada parte
+    <BATCH_DIR>/<trabajo>/records.json  ← artículos del trabajo (para retomar)
+    <BATCH_DIR>/<trabajo>/COMPLETED     ← el trabajo terminó; no se retoma
+
+• Flujo: escribir JSONL → `files.create(purpose="batch")` →
+  `batches.create` → sondear → descargar → fusionar por `custom_id`
+  (derivado de la URL canónica, o de la clave de caché en embeddings).
+• `state.json` se reescribe tras cada paso: si el proceso se corta, volver
+  a lanzar el mismo trabajo retoma el sondeo (o la descarga) sin reenviar.
+  Las partes que terminaron fallidas, caducadas o canceladas se reenvían al
+  retomar, solo con las peticiones que siguen sin respuesta.  Un trabajo
+  marcado como terminado no se retoma: se empieza de cero con datos nuevos.
+• Las peticiones que el lote no devuelve (error, caducidad) se completan con
+  la llamada interactiva de siempre, con concurrencia acotada; los fallos
+  individuales se registran sin abortar la etapa.
+• El cliente es el de `agents.llm`, que toma `OPENAI_BASE_URL`: basta con
+  apuntarlo a un servidor local compatible para probar sin la API real.
+• Los embeddings no se devuelven: se guardan en `EmbeddingCache`, así el
+  RAGAgent posterior los encuentra todos sin llamar a la API.
+"""
+import asyncio, json, logging, os, shutil, time
+from pathlib import Path
+import numpy as np
+from agents.llm import get_client
+from agents.cache import CACHE_DIR, canonical_url, fingerprint
+from agents.embeddings import embedder
+
+log = logging.getLogger(__name__)
+
+BATCH_DIR          = Path(os.getenv("BATCH_DIR", CACHE_DIR / "batches"))
+BATCH_POLL_SECONDS = float(os.getenv("BATCH_POLL_SECONDS", "30"))
+BATCH_WINDOW       = os.getenv("BATCH_COMPLETION_WINDOW", "24h")
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "50000"))   # por fichero
+# llamadas interactivas simultáneas para lo que el lote no devolvió
+BATCH_FALLBACK_CONCURRENCY = int(os.getenv("BATCH_FALLBACK_CONCURRENCY", "8"))
+
+_DONE = {"completed", "failed", "expired", "cancelled"}
+
+
+class BatchRunner:
+    def __init__(self, job: str, root: str | Path | None = None,
+                 poll: float = BATCH_POLL_SECONDS,
+                 progress_cb=lambda msg: None):
+        """`job` identifica el trabajo: reutilizarlo retoma lo ya enviado."""
+        self.root = Path(root or BATCH_DIR) / job
+        self.poll = poll
+        self.progress_cb = progress_cb
+        self.failed: dict[str, list[str]] = {}       # etapa → URLs sin resultado
+
+    # ───────── estado ─────────
+    def completed(self) -> bool:
+        """¿Una ejecución anterior del trabajo llegó hasta el final?"""
+        return (self.root / "COMPLETED").exists()
+
+    def mark_completed(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        (self.root / "COMPLETED").write_text(str(time.time()))
+
+    def reset(self):
+        """Borra el estado del trabajo (artículos, lotes, marca de fin)."""
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def load_records(self) -> list[dict] | None:
+        """Artículos guardados por una ejecución anterior del trabajo, o None."""
+        try:
+            return json.loads((self.root / "records.json").read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+
+    def save_records(self, records: list[dict]):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.root / "records.json.tmp"
+        tmp.write_text(json.dumps(records, ensure_ascii=False, default=str),
+                       encoding="utf-8")
+        os.replace(tmp, self.root / "records.json")
+
+    @staticmethod
+    def _load_state(d: Path) -> dict:
+        try:
+            return json.loads((d / "state.json").read_text())
+        except FileNotFoundError:
+            return {"parts": []}
+
+    @staticmethod
+    def _save_state(d: Path, state: dict):
+        tmp = d / "state.json.tmp"
+        tmp.write_text(json.dumps(state, indent=1))
+        os.replace(tmp, d / "state.json")
+
+    # ───────── un lote completo ─────────
+    async def _submit(self, stage: str, endpoint: str,
+                      bodies: dict[str, dict]) -> dict[str, dict]:
+        """Envía `bodies` (custom_id → cuerpo) y devuelve custom_id → respuesta."""
+        d = self.root / stage
+        d.mkdir(parents=True, exist_ok=True)
+        state = self._load_state(d)
+        client = get_client()
+
+        if not state["parts"]:
+            ids = list(bodies)
+            for n, start in enumerate(range(0, len(ids), BATCH_MAX_REQUESTS)):
+                path = d / f"requests.{n:03d}.jsonl"
+                with open(path, "w", encoding="utf-8") as f:
+                    for cid in ids[start:start + BATCH_MAX_REQUESTS]:
+                        f.write(json.dumps({"custom_id": cid, "method": "POST",
+                                            "url": endpoint, "body": bodies[cid]},
+                                           ensure_ascii=False) + "\n")
+                state["parts"].append({"requests": path.name})
+            self._save_state(d, state)
+        else:
+            self._resubmit_failed(d, state, bodies)
+
+        for n, part in enumerate(state["parts"]):
+            if "file_id" not in part:
+                with open(d / part["requests"], "rb") as f:
+                    part["file_id"] = (await client.files.create(file=f, purpose="batch")).id
+                self._save_state(d, state)
+            if "batch_id" not in part:
+                part["batch_id"] = (await client.batches.create(
+                    input_file_id=part["file_id"], endpoint=endpoint,
+                    completion_window=BATCH_WINDOW,
+                    metadata={"job": self.root.name, "stage": stage})).id
+                self._save_state(d, state)
+                log.info("batch: %s parte %d enviada (%s)", stage, n, part["batch_id"])
+
+        await asyncio.gather(*(self._wait(d, state, part) for part in state["parts"]))
+
+        results: dict[str, dict] = {}
+        for part in state["parts"]:
+            out = d / part.get("output", "")
+            if not part.get("output") or not out.exists():
+                continue
+            with open(out, encoding="utf-8") as f:
+                for line in f:
+                    row = json.loads(line)
+                    resp = row.get("response") or {}
+                    if resp.get("status_code") == 200:
+                        results[row["custom_id"]] = resp["body"]
+        return results
+
+    @staticmethod
+    def _answered(d: Path, part: dict) -> set[str]:
+        """custom_id con respuesta 200 en la salida descargada de `part`."""
+        out = d / part.get("output", "")
+        if not part.get("output") or not out.exists():
+            return set()
+        with open(out, encoding="utf-8") as f:
+            return {row["custom_id"] for row in map(json.loads, f)
+                    if (row.get("response") or {}).get("status_code") == 200}
+
+    def _resubmit_failed(self, d: Path, state: dict, bodies: dict[str, dict]):
+        """
+        Al retomar: las partes que terminaron sin completarse se sustituyen
+        por una parte nueva con las peticiones aún pedidas y sin respuesta.
+        """
+        for part in list(state["parts"]):
+            if part.get("status") not in _DONE - {"completed"} or part.get("resubmitted"):
+                continue
+            answered = self._answered(d, part)
+            with open(d / part["requests"], encoding="utf-8") as f:
+                lines = [line for line in f
+                         if (cid := json.loads(line)["custom_id"]) in bodies
+                         and cid not in answered]
+            part["resubmitted"] = True
+            if lines:
+                path = d / f"requests.{len(state['parts']):03d}.jsonl"
+                path.write_text("".join(lines), encoding="utf-8")
+                state["parts"].append({"requests": path.name})
+                log.info("batch: %s (%s) se reenvía con %d peticiones",
+                         part.get("batch_id"), part["status"], len(lines))
+        self._save_state(d, state)
+
+    async def _wait(self, d: Path, state: dict, part: dict):
+        """Sondea una parte hasta que termina y descarga su salida."""
+        client = get_client()
+        t0 = time.monotonic()
+        while "status" not in part or part["status"] not in _DONE:
+            batch = await client.batches.retrieve(part["batch_id"])
+            part["status"] = batch.status
+            part["output_file_id"] = batch.output_file_id
+            part["error_file_id"] = getattr(batch, "error_file_id", None)
+            self._save_state(d, state)
+            if batch.status in _DONE:
+                break
+            counts = batch.request_counts
+            self.progress_cb(f"⏳ Lote {part['batch_id']}: {batch.status}"
+                             + (f" ({counts.completed}/{counts.total})" if counts else "")
+                             + f" · {time.monotonic() - t0:.0f}s")
+            await asyncio.sleep(self.poll)
+
+        if part["status"] != "completed" or part.get("error_file_id"):
+            log.warning("batch: %s terminó como %s (error_file_id=%s)",
+                        part["batch_id"], part["status"], part.get("error_file_id"))
+        # también los caducados/cancelados pueden traer respuestas parciales
+        if part.get("output_file_id") and "output" not in part:
+            content = await client.files.content(part["output_file_id"])
+            name = part["requests"].replace("requests", "output")
+            (d / name).write_bytes(content.content)
+            part["output"] = name
+            self._save_state(d, state)
+
+    # ───────── etapas ─────────
+    async def run_chat(self, stage: str, agent, records: list[dict],
+                       call=None) -> list[dict]:
+        """
+        Ejecuta la etapa `stage` de `agent` (con `build_request` /
+        `parse_response`) sobre `records` y fusiona las respuestas por id.
+        Lo que el lote no devuelve va por `agent.run`, como mucho
+        `BATCH_FALLBACK_CONCURRENCY` a la vez y envuelto en `call(fn, **kwargs)`
+        si se da (p. ej. el limitador de etapa del orquestador).  Las URLs que
+        fallan también ahí quedan en `self.failed[stage]`.
+        """
+        self.failed[stage] = []
+        if not records:
+            return records
+        ids = [f"{stage}-{fingerprint(canonical_url(rec['url']))}" for rec in records]
+        bodies = {cid: agent.build_request(rec) for cid, rec in zip(ids, records)}
+        results = await self._submit(stage, "/v1/chat/completions", bodies)
+
+        missing = []
+        for cid, rec in zip(ids, records):
+            body = results.get(cid)
+            if body is None:
+                missing.append(rec)
+                continue
+            agent.parse_response(rec, body["choices"][0]["message"].get("content"))
+        if missing:
+            log.info("batch: %d de %d peticiones de %s por la vía interactiva",
+                     len(missing), len(records), stage)
+            arg = "record" if stage == "classify" else "article"
+            sem = asyncio.Semaphore(max(1, BATCH_FALLBACK_CONCURRENCY))
+
+            async def _one(rec):
+                async with sem:
+                    kwargs = {arg: rec}
+                    return await (call(agent.run, **kwargs) if call else agent.run(**kwargs))
+
+            outs = await asyncio.gather(*(_one(rec) for rec in missing),
+                                        return_exceptions=True)
+            failed = [(rec, e) for rec, e in zip(missing, outs) if isinstance(e, Exception)]
+            for rec, e in failed:
+                log.warning("batch: %s falló para %s: %s", stage, rec["url"], e)
+            self.failed[stage] = [rec["url"] for rec, _ in failed]
+        return records
+
+    async def run_embeddings(self, texts: list[str]):
+        """Embeddings de `texts` por lote, guardados en la caché del embedder."""
+        cache = embedder.cache
+        if cache is None:
+            log.warning("batch: EMBED_CACHE desactivada; se omiten los embeddings por lote")
+            return
+        keys = [cache.key(t or "") for t in texts]
+        found = cache.get_many(keys)
+        todo = {k: t or "" for k, t in zip(keys, texts) if k not in found}
+        if not todo:
+            return
+        inputs, _ = embedder._prepare(list(todo.values()))
+        extra = {"dimensions": embedder.dimensions} if embedder.dimensions else {}
+        bodies = {k: {"model": embedder.model, "input": t, **extra}
+                  for k, t in zip(todo, inputs)}
+        results = await self._submit("embeddings", "/v1/embeddings", bodies)
+
+        got = [(k, results[k]["data"][0]["embedding"]) for k in todo if k in results]
+        if got:
+            cache.put_many([k for k, _ in got],
+                           np.asarray([v for _, v in got], dtype="float32"))
+        log.info("batch: %d embeddings guardados en caché (%d sin respuesta)",
+                 len(got), len(todo) - len(got))
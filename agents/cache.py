@@ -0,0 +1,368 @@
+# agents/cache.py
+"""
+StageCache
+──────────
+Caché persistente (SQLite) de las salidas por artículo de las etapas LLM
+(resumen, extracción, clasificación).  `GeocodeCache`, al final, guarda
+las coordenadas ya resueltas por GeoAgent, `ArticleStore` los cuerpos de
+artículo descargados y `OCRCache` el texto leído en cada imagen.
+
+• Clave = URL canónica + etapa + huella del prompt/modelo: si cambia la
+  plantilla o el modelo, la entrada anterior simplemente deja de coincidir.
+• Expulsión LRU por tamaño total (bytes del JSON almacenado).  Las
+  lecturas no escriben: la hora de acceso se acumula en memoria y se vuelca
+  en lote (con el siguiente `put`, al expulsar o cada
+  `STAGE_CACHE_TOUCH_BATCH` aciertos).
+• Contadores de aciertos/fallos para saber cuánto gasto LLM se evita.
+"""
+import hashlib, json, logging, os, sqlite3, threading, time, urllib.parse, zlib
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+CACHE_DIR = Path(os.getenv("CENTRUS_CACHE_DIR", Path.home() / ".cache" / "centrus"))
+STAGE_CACHE_MAX_MB = float(os.getenv("STAGE_CACHE_MAX_MB", "256"))
+# accesos LRU acumulados en memoria antes de escribirlos en un solo UPDATE
+STAGE_CACHE_TOUCH_BATCH = int(os.getenv("STAGE_CACHE_TOUCH_BATCH", "256"))
+
+# parámetros de seguimiento que no cambian el contenido de la página
+_TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "mc_cid", "mc_eid", "ocid", "ref", "cmpid"}
+
+
+def canonical_url(url: str) -> str:
+    """
+    Normaliza una URL para usarla como clave: esquema/host en minúsculas,
+    sin fragmento, sin parámetros de seguimiento (utm_*, fbclid…), query
+    ordenada y sin “/” final.
+    """
+    parts = urllib.parse.urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (k, v) for k, v in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in _TRACKING_PARAMS
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urllib.parse.urlunsplit(
+        ((parts.scheme or "https").lower(), host, path,
+         urllib.parse.urlencode(query), "")
+    )
+
+
+def fingerprint(*parts) -> str:
+    """Huella corta y estable de prompt, modelo y cualquier parámetro relevante."""
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(str(p).encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()[:16]
+
+
+class StageCache:
+    """Caché clave‑valor en SQLite con expulsión LRU por tamaño."""
+
+    def __init__(self, path: str | Path | None = None,
+                 max_bytes: int | None = None):
+        self.path = Path(path or CACHE_DIR / "stages.sqlite3")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_bytes or STAGE_CACHE_MAX_MB * 1024 * 1024)
+        self.hits = self.misses = 0
+        self._touched: dict[str, float] = {}      # clave → último acceso sin volcar
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS stage_cache (
+                key      TEXT PRIMARY KEY,
+                url      TEXT NOT NULL,
+                stage    TEXT NOT NULL,
+                value    TEXT NOT NULL,
+                size     INTEGER NOT NULL,
+                accessed REAL NOT NULL
+            )""")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS stage_cache_lru ON stage_cache(accessed)")
+        self._db.commit()
+        self._bytes = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM stage_cache").fetchone()[0]
+
+    @staticmethod
+    def _key(url: str, stage: str, fp: str) -> str:
+        return hashlib.sha256(f"{canonical_url(url)}|{stage}|{fp}".encode()).hexdigest()
+
+    def get(self, url: str, stage: str, fp: str) -> dict | None:
+        key = self._key(url, stage, fp)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM stage_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[key] = time.time()
+            if len(self._touched) >= STAGE_CACHE_TOUCH_BATCH:
+                self._flush_touched()
+                self._db.commit()
+        return json.loads(row[0])
+
+    def _flush_touched(self):
+        """Escribe los accesos pendientes (con el lock tomado; sin commit)."""
+        if self._touched:
+            self._db.executemany("UPDATE stage_cache SET accessed = ? WHERE key = ?",
+                                 [(t, k) for k, t in self._touched.items()])
+            self._touched.clear()
+
+    def put(self, url: str, stage: str, fp: str, value: dict):
+        key  = self._key(url, stage, fp)
+        blob = json.dumps(value, ensure_ascii=False, default=str)
+        size = len(blob.encode("utf-8"))
+        with self._lock:
+            self._touched.pop(key, None)
+            self._flush_touched()
+            old = self._db.execute(
+                "SELECT size FROM stage_cache WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO stage_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (key, canonical_url(url), stage, blob, size, time.time()))
+            self._bytes += size - (old[0] if old else 0)
+            if self._bytes > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        """Borra las entradas menos usadas hasta bajar al 90 % del máximo."""
+        target = int(self.max_bytes * 0.9)
+        rows = self._db.execute(
+            "SELECT key, size FROM stage_cache ORDER BY accessed").fetchall()
+        doomed = []
+        for key, size in rows:
+            if self._bytes <= target:
+                break
+            doomed.append((key,))
+            self._bytes -= size
+        self._db.executemany("DELETE FROM stage_cache WHERE key = ?", doomed)
+        log.info("StageCache: expulsadas %d entradas", len(doomed))
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._flush_touched()
+            self._db.commit()
+            entries = self._db.execute("SELECT COUNT(*) FROM stage_cache").fetchone()[0]
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": entries, "bytes": self._bytes}
+
+
+GEOCODE_NEGATIVE_TTL_DAYS = float(os.getenv("GEOCODE_NEGATIVE_TTL_DAYS", "7"))
+
+
+class GeocodeCache:
+    """
+    Caché persistente lugar → (lat, lon).  También recuerda los lugares que
+    Nominatim no encontró (caché negativa) durante `negative_ttl` segundos,
+    para no repetir consultas inútiles en cada ejecución.
+    """
+
+    def __init__(self, path: str | Path | None = None,
+                 negative_ttl: float = GEOCODE_NEGATIVE_TTL_DAYS * 86400):
+        self.path = Path(path or CACHE_DIR / "geocode.sqlite3")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.negative_ttl = negative_ttl
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS geocode (
+                place   TEXT PRIMARY KEY,
+                lat     REAL,
+                lon     REAL,
+                updated REAL NOT NULL
+            )""")
+        self._db.commit()
+
+    @staticmethod
+    def _key(place: str) -> str:
+        return " ".join(place.casefold().split())
+
+    def get(self, place: str) -> tuple | None:
+        """(lat, lon), (None, None) si es un fallo reciente conocido, o None."""
+        with self._lock:
+            row = self._db.execute("SELECT lat, lon, updated FROM geocode WHERE place = ?",
+                                   (self._key(place),)).fetchone()
+        if row is None or (row[0] is None and time.time() - row[2] > self.negative_ttl):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0], row[1]
+
+    def put(self, place: str, lat: float | None, lon: float | None):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?)",
+                             (self._key(place), lat, lon, time.time()))
+            self._db.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
+
+
+ARTICLE_TTL_DAYS     = float(os.getenv("ARTICLE_TTL_DAYS", "30"))
+ARTICLE_STORE_MAX_MB = float(os.getenv("ARTICLE_STORE_MAX_MB", "512"))
+
+
+class ArticleStore:
+    """
+    Almacén persistente URL canónica → cuerpo del artículo (texto comprimido
+    con zlib, título, fecha de publicación, fecha de descarga y validadores
+    HTTP ETag / Last‑Modified).
+
+    • Una entrada con más de `ttl` segundos sigue devolviéndose marcada como
+      `stale`: el llamador decide si la revalida o la vuelve a descargar.
+    • Expulsión por tamaño: primero las caducadas, luego las menos usadas.
+    """
+
+    def __init__(self, path: str | Path | None = None,
+                 ttl: float = ARTICLE_TTL_DAYS * 86400,
+                 max_bytes: int | None = None):
+        self.path = Path(path or CACHE_DIR / "articles.sqlite3")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = int(max_bytes or ARTICLE_STORE_MAX_MB * 1024 * 1024)
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS articles (
+                url           TEXT PRIMARY KEY,
+                title         TEXT,
+                published     TEXT,
+                body          BLOB NOT NULL,
+                etag          TEXT,
+                last_modified TEXT,
+                fetched       REAL NOT NULL,
+                accessed      REAL NOT NULL,
+                size          INTEGER NOT NULL
+            )""")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS articles_lru ON articles(accessed)")
+        self._db.commit()
+        self._bytes = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM articles").fetchone()[0]
+
+    def get(self, url: str) -> dict | None:
+        """Entrada de `url` ({"text", "title", ..., "stale"}) o None."""
+        key = canonical_url(url)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT title, published, body, etag, last_modified, fetched "
+                "FROM articles WHERE url = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE articles SET accessed = ? WHERE url = ?",
+                             (time.time(), key))
+            self._db.commit()
+        title, published, body, etag, last_modified, fetched = row
+        stale = time.time() - fetched > self.ttl
+        if stale:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return {"url": key, "title": title, "published": published,
+                "text": zlib.decompress(body).decode("utf-8"),
+                "etag": etag, "last_modified": last_modified,
+                "fetched": fetched, "stale": stale}
+
+    def put(self, url: str, text: str, title: str | None = None,
+            published: str | None = None, etag: str | None = None,
+            last_modified: str | None = None):
+        key  = canonical_url(url)
+        body = zlib.compress((text or "").encode("utf-8"), 6)
+        size = len(body) + len(title or "")
+        now  = time.time()
+        with self._lock:
+            old = self._db.execute(
+                "SELECT size FROM articles WHERE url = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO articles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, title, published, body, etag, last_modified, now, now, size))
+            self._bytes += size - (old[0] if old else 0)
+            if self._bytes > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+    def touch(self, url: str):
+        """Marca como recién descargada una entrada revalidada (304)."""
+        now = time.time()
+        with self._lock:
+            self._db.execute("UPDATE articles SET fetched = ?, accessed = ? WHERE url = ?",
+                             (now, now, canonical_url(url)))
+            self._db.commit()
+
+    def _evict(self):
+        """Borra caducadas y después las menos usadas hasta el 90 % del máximo."""
+        target = int(self.max_bytes * 0.9)
+        rows = self._db.execute(
+            "SELECT url, size FROM articles ORDER BY fetched < ? DESC, accessed",
+            (time.time() - self.ttl,)).fetchall()
+        doomed = []
+        for url, size in rows:
+            if self._bytes <= target:
+                break
+            doomed.append((url,))
+            self._bytes -= size
+        self._db.executemany("DELETE FROM articles WHERE url = ?", doomed)
+        log.info("ArticleStore: expulsados %d artículos", len(doomed))
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": entries, "bytes": self._bytes}
+
+
+class OCRCache:
+    """Caché persistente huella de imagen → texto reconocido por Tesseract."""
+
+    def __init__(self, path: str | Path | None = None):
+        self.path = Path(path or CACHE_DIR / "ocr.sqlite3")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS ocr (
+                hash    TEXT PRIMARY KEY,
+                text    TEXT NOT NULL,
+                updated REAL NOT NULL
+            )""")
+        self._db.commit()
+
+    def get(self, image_hash: str) -> str | None:
+        with self._lock:
+            row = self._db.execute("SELECT text FROM ocr WHERE hash = ?",
+                                   (image_hash,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put(self, image_hash: str, text: str):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO ocr VALUES (?, ?, ?)",
+                             (image_hash, text, time.time()))
+            self._db.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
@@ -8,11 +8,16 @@ ClassifyAgent 2.0
   (CoT) y después devuelva SOLO el JSON con `score` y `justificacion`.
 • Controla que el score sea entero dentro del rango; si el modelo se equivoca,
   lo fuerza a N/D y registra un warning.
+• `run_batch` clasifica muchos resúmenes en una sola petición (con ids y un
+  arreglo JSON de respuestas), con lotes medidos en tokens; solo los
+  elementos que no pasan la validación se repiten uno a uno con `run`.
 """
 from crewai import Agent
 from typing import ClassVar
-from openai import OpenAI
-import json, logging, re
+from agents.llm import get_client, CHAT_MODEL
+from agents.cache import fingerprint
+from agents.prompt_budget import count_tokens, for_stage, select, stage_signature
+import asyncio, json, logging, os, re
 
 log = logging.getLogger(__name__)
 
@@ -39,8 +44,39 @@ INSTRUCCIONES
    {{"score": INT, "justificacion": "motivo brevemente en ≤25 palabras"}}
 """
 
+BATCH_PROMPT = BAROMETRO.split("INSTRUCCIONES")[0] + """
+INSTRUCCIONES
+─────────────
+Clasifica CADA noticia de la lista por separado.  Piensa internamente y
+devuelve **exclusivamente** un JSON válido con un elemento por noticia:
+   {"items": [{"id": "ID de la noticia", "score": INT,
+               "justificacion": "motivo en ≤25 palabras"}, ...]}
+"""
+
+# lote: tokens de entrada (instrucciones + noticias) y nº máximo de noticias
+CLASSIFY_BATCH_TOKENS      = int(os.getenv("CLASSIFY_BATCH_TOKENS", "12000"))
+CLASSIFY_BATCH_MAX_ITEMS   = int(os.getenv("CLASSIFY_BATCH_MAX_ITEMS", "40"))
+CLASSIFY_BATCH_ITEM_TOKENS = int(os.getenv("CLASSIFY_BATCH_ITEM_TOKENS", "600"))
+CLASSIFY_BATCH_CONCURRENCY = int(os.getenv("CLASSIFY_BATCH_CONCURRENCY", "4"))
+
 JSON_RE = re.compile(r"\{.*\}", re.S)    # para extraer JSON bruto si hace falta
 
+
+def _parse_json(content: str | None) -> dict:
+    """Objeto JSON de la respuesta; {} si no hay ninguno válido."""
+    content = content or ""
+    m = JSON_RE.search(content)
+    try:
+        payload = json.loads(m.group(0)) if m else json.loads(content)
+    except Exception:
+        log.warning("JSON inválido recibido: %s", content[:120])
+        return {}
+    return payload if isinstance(payload, dict) else {}
+
+
+def _valid_score(score) -> bool:
+    return isinstance(score, int) and not isinstance(score, bool) and -5 <= score <= 5
+
 class ClassifyAgent(Agent):
     role: str = "Analista humanitario"
     goal: str = "Asignar puntaje de severidad (–5 … +5)"
@@ -52,35 +88,35 @@ class ClassifyAgent(Agent):
     name: ClassVar[str] = "classifier"
     description: ClassVar[str] = "Clasifica severidad y justifica"
 
-    async def run(self, *, record: dict):
-        # 1) Construir prompt — usa texto completo si está, si no el summary.
+    # campos que añade la etapa y huella para la caché del orquestador
+    stage_fields: ClassVar[tuple[str, ...]] = ("score", "justificacion")
+    stage_fingerprint: ClassVar[str] = fingerprint(
+        BAROMETRO, CHAT_MODEL, stage_signature("classify"))
+    batch_fingerprint: ClassVar[str] = fingerprint(
+        BATCH_PROMPT, CHAT_MODEL, stage_signature("classify"), CLASSIFY_BATCH_ITEM_TOKENS)
+
+    # ─── petición / respuesta (compartidas con agents.batch) ───
+    def build_request(self, record: dict) -> dict:
+        """Argumentos de `chat.completions.create` para `record`."""
+        # usa texto completo si está, si no el summary
         body = record.get("text") or record.get("summary") or record["title"]
-        body = body[:7000]                      # evita prompts excesivos
+        body = for_stage(body, "classify")      # pasajes clave dentro del presupuesto
 
         prompt = f"{BAROMETRO}\n\nNoticia:\n\"\"\"{body}\"\"\""
+        return {
+            "model": CHAT_MODEL,
+            "messages": [{"role": "user", "content": prompt}],
+            "response_format": {"type": "json_object"},
+        }
 
-        client = OpenAI()
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"}
-        )
-
-        raw_msg = resp.choices[0].message
-        payload = raw_msg.json() if hasattr(raw_msg, "json") else raw_msg.content
-
-        # 2) Si el modelo devolvió string, intenta extraer JSON dentro
-        if isinstance(payload, str):
-            m = JSON_RE.search(payload)
-            try:
-                payload = json.loads(m.group(0)) if m else json.loads(payload)
-            except Exception:
-                log.warning("JSON inválido recibido: %s", payload[:120])
-                payload = {}
-
-        # 3) Validar score
+    def parse_response(self, record: dict, content: str | None) -> dict:
+        # el contenido del mensaje es el JSON (message.json() serializaría
+        # el objeto mensaje completo, no la respuesta)
+        payload = _parse_json(content)
+
+        # validar score
         score = payload.get("score")
-        if not isinstance(score, int) or score < -5 or score > 5:
+        if not _valid_score(score):
             log.warning("Score fuera de rango/ausente: %s", score)
             score = "N/D"
 
@@ -88,3 +124,86 @@ class ClassifyAgent(Agent):
 
         record.update({"score": score, "justificacion": justific})
         return record
+
+    async def run(self, *, record: dict):
+        resp = await get_client().chat.completions.create(**self.build_request(record))
+        return self.parse_response(record, resp.choices[0].message.content)
+
+    # ─── modo por lotes ───
+    @staticmethod
+    def _batches(records: list[dict]) -> list[list[tuple[str, dict, str]]]:
+        """Agrupa (id, registro, cuerpo) sin pasar del presupuesto de tokens."""
+        budget = CLASSIFY_BATCH_TOKENS - count_tokens(BATCH_PROMPT)
+        batches, cur, used = [], [], 0
+        for i, rec in enumerate(records):
+            body = rec.get("summary") or rec.get("text") or rec.get("title") or ""
+            body = select(body, CLASSIFY_BATCH_ITEM_TOKENS)
+            cost = count_tokens(body) + 12          # id y separadores
+            if cur and (used + cost > budget or len(cur) >= CLASSIFY_BATCH_MAX_ITEMS):
+                batches.append(cur)
+                cur, used = [], 0
+            cur.append((f"n{i}", rec, body))
+            used += cost
+        if cur:
+            batches.append(cur)
+        return batches
+
+    async def _classify_batch(self, batch: list[tuple[str, dict, str]]) -> list[dict]:
+        """Una petición para todo el lote; devuelve los registros que fallaron."""
+        noticias = "\n\n".join(f'[{id_}]\n"""{body}"""' for id_, _, body in batch)
+        try:
+            resp = await get_client().chat.completions.create(
+                model=CHAT_MODEL,
+                messages=[{"role": "user",
+                           "content": f"{BATCH_PROMPT}\n\nNoticias:\n{noticias}"}],
+                response_format={"type": "json_object"},
+            )
+            items = _parse_json(resp.choices[0].message.content).get("items")
+        except Exception as e:
+            log.warning("ClassifyAgent: lote de %d falló: %s", len(batch), e)
+            items = None
+        answers = {str(it.get("id")): it for it in items or [] if isinstance(it, dict)}
+
+        failed = []
+        for id_, rec, _ in batch:
+            it = answers.get(id_, {})
+            justific = it.get("justificacion")
+            if _valid_score(it.get("score")) and isinstance(justific, str) and justific:
+                rec.update({"score": it["score"], "justificacion": justific})
+            else:
+                failed.append(rec)
+        return failed
+
+    async def run_batch(self, *, records: list[dict],
+                        concurrency: int | None = None, call=None) -> list[dict]:
+        """
+        Clasifica `records` por lotes (clasifica el resumen; si falta, el
+        texto o el título).  Los elementos ausentes o inválidos en la
+        respuesta del lote se reintentan individualmente con `run`.
+        Devuelve la misma lista con `score` y `justificacion`.
+
+        Como mucho `concurrency` peticiones a la vez (lotes o individuales);
+        `call(fn, **kwargs)`, si se da, envuelve cada una (p. ej. el
+        limitador de etapa del orquestador).
+        """
+        batches = self._batches(records)
+        sem = asyncio.Semaphore(max(1, concurrency or CLASSIFY_BATCH_CONCURRENCY))
+
+        async def _limited(fn, **kwargs):
+            async with sem:
+                return await (call(fn, **kwargs) if call else fn(**kwargs))
+
+        failed = [rec for out in await asyncio.gather(
+                      *(_limited(self._classify_batch, batch=b) for b in batches))
+                  for rec in out]
+        if failed:
+            log.info("ClassifyAgent: %d de %d registros por la vía individual",
+                     len(failed), len(records))
+            outs = await asyncio.gather(*(_limited(self.run, record=rec) for rec in failed),
+                                        return_exceptions=True)
+            for rec, out in zip(failed, outs):
+                if isinstance(out, Exception):
+                    log.warning("ClassifyAgent: falló '%s': %s", rec.get("url"), out)
+                    rec.update({"score": "N/D", "justificacion": "N/D"})
+        log.info("ClassifyAgent: %d registros en %d lotes", len(records), len(batches))
+        return records
@@ -1,10 +1,10 @@
 # agents/db_embed.py
 from crewai import Agent
 from typing import ClassVar
-from openai import OpenAI
-import faiss, numpy as np, pandas as pd
-
-client = OpenAI()
+from agents.embeddings import embedder
+from agents.index_store import ensure_writable
+from agents import index_manager
+import asyncio, numpy as np, pandas as pd
 
 class DBEmbedAgent(Agent):
     role: str = "Generador de embeddings de BD"
@@ -16,15 +16,19 @@ class DBEmbedAgent(Agent):
 
     async def run(self, *, df: pd.DataFrame, faiss_index=None, faiss_payloads=None):
         texts = df.astype(str).agg(" | ".join, axis=1).tolist()
-        vecs = [client.embeddings.create(
-            model="text-embedding-3-small",
-            input=t).data[0].embedding for t in texts]
+        # miles de filas por petición, varios lotes en paralelo
+        vecs = await embedder.embed(texts)
 
-        dim = len(vecs[0])
+        dim = vecs.shape[1]
         if faiss_index is None:
-            faiss_index = faiss.IndexFlatL2(dim)
+            faiss_index = index_manager.new_index(dim, "l2")
             faiss_payloads = []
-        faiss_index.add(np.array(vecs, dtype="float32"))
-        faiss_payloads = np.concatenate([faiss_payloads, np.array(texts)])
+        faiss_index = ensure_writable(faiss_index)    # p. ej. cargado con mmap
+        # migra a IVF/HNSW si crece: entrenar y reinsertar tarda, fuera del event loop
+        faiss_index = await asyncio.to_thread(index_manager.add, faiss_index, vecs)
+        if hasattr(faiss_payloads, "extend"):        # list / PayloadStore
+            faiss_payloads.extend(texts)
+        else:
+            faiss_payloads = np.concatenate([faiss_payloads, np.array(texts)])
 
         return {"faiss_index": faiss_index, "faiss_payloads": faiss_payloads}
@@ -0,0 +1,287 @@
+# agents/embeddings.py
+"""
+EmbeddingService
+────────────────
+Servicio de embeddings compartido por RAGAgent, DBEmbedAgent y QAAgent.
+
+• Empaqueta muchos textos por petición, contando tokens con `tiktoken` para
+  no superar los límites por petición (nº de entradas y tokens totales).
+• Recorta a `EMBED_MAX_TOKENS_PER_INPUT` los textos demasiado largos.
+• Lanza varios lotes a la vez y devuelve los vectores en el orden de entrada
+  como una sola matriz float32 (n, dim).
+• Consulta antes `EmbeddingCache` (en disco): solo se piden a la API los
+  textos nunca vistos para ese modelo y dimensión.
+"""
+import asyncio, hashlib, logging, os, sqlite3, threading, time
+from pathlib import Path
+import numpy as np
+import tiktoken
+from agents.llm import get_client, EMBEDDING_MODEL
+from agents.cache import CACHE_DIR
+
+log = logging.getLogger(__name__)
+
+EMBED_MAX_INPUTS             = int(os.getenv("EMBED_MAX_INPUTS", "2048"))
+EMBED_MAX_TOKENS_PER_REQUEST = int(os.getenv("EMBED_MAX_TOKENS_PER_REQUEST", "250000"))
+EMBED_MAX_TOKENS_PER_INPUT   = int(os.getenv("EMBED_MAX_TOKENS_PER_INPUT", "8191"))
+EMBED_CONCURRENCY            = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_CACHE                  = os.getenv("EMBED_CACHE", "1") != "0"
+EMBED_CACHE_MAX_ROWS         = int(os.getenv("EMBED_CACHE_MAX_ROWS", "2000000"))
+
+# dimensión nativa de cada modelo (para ubicar la caché sin pedir nada a la API)
+_MODEL_DIMS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+
+class EmbeddingCache:
+    """
+    Caché persistente hash(modelo + dim + texto) → vector.
+
+    Los vectores se añaden a un fichero float32 de solo‑anexado que se lee con
+    `np.memmap` (no se carga entero en RAM); un índice SQLite guarda
+    clave → fila y la hora del último uso.  Al superar `max_rows` se olvidan
+    las claves menos usadas, y cuando las filas huérfanas superan a las vivas
+    el fichero se compacta en una generación nueva (`vectors.<gen>.f32`) que
+    solo pasa a ser la vigente al confirmar el índice.
+    """
+
+    def __init__(self, model: str, dim: int,
+                 root: str | Path | None = None,
+                 max_rows: int = EMBED_CACHE_MAX_ROWS):
+        self.model, self.dim, self.max_rows = model, dim, max_rows
+        self.dir = Path(root or CACHE_DIR / "embeddings") / f"{model}-{dim}"
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.hits = self.misses = 0
+        self._row_bytes = 4 * dim
+        self._lock = threading.Lock()
+        self._mm = None
+
+        self._db = sqlite3.connect(self.dir / "index.sqlite3", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS emb_index (
+                key      TEXT PRIMARY KEY,
+                row      INTEGER NOT NULL,
+                accessed REAL NOT NULL
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS emb_lru ON emb_index(accessed)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS emb_meta (gen INTEGER NOT NULL)")
+        row = self._db.execute("SELECT gen FROM emb_meta").fetchone()
+        if row is None:
+            self._db.execute("INSERT INTO emb_meta VALUES (0)")
+        self._gen = row[0] if row else 0
+
+        # restos de una compactación interrumpida
+        for f in self.dir.glob("vectors.*.f32"):
+            if f != self._vec_path(self._gen):
+                f.unlink(missing_ok=True)
+
+        # descarta una fila a medio escribir (p. ej. tras un corte)
+        self.vec_path = self._vec_path(self._gen)
+        self.vec_path.touch()
+        size = self.vec_path.stat().st_size
+        if size % self._row_bytes:
+            with open(self.vec_path, "r+b") as f:
+                f.truncate(size - size % self._row_bytes)
+        self._rows = self.vec_path.stat().st_size // self._row_bytes
+
+        # filas que apuntan más allá del fichero (índice más nuevo que los datos)
+        self._db.execute("DELETE FROM emb_index WHERE row >= ?", (self._rows,))
+        self._db.commit()
+
+    def _vec_path(self, gen: int) -> Path:
+        return self.dir / f"vectors.{gen}.f32"
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}|{self.dim}|{text}".encode("utf-8")).hexdigest()
+
+    def _matrix(self) -> np.ndarray:
+        if self._mm is None or self._mm.shape[0] != self._rows:
+            self._mm = (np.memmap(self.vec_path, dtype="float32", mode="r",
+                                  shape=(self._rows, self.dim))
+                        if self._rows else np.zeros((0, self.dim), dtype="float32"))
+        return self._mm
+
+    def get_many(self, keys: list[str]) -> dict[str, np.ndarray]:
+        """Vectores encontrados, por clave (las ausentes no aparecen)."""
+        uniq = list(dict.fromkeys(keys))
+        found: dict[str, int] = {}
+        with self._lock:
+            for i in range(0, len(uniq), 500):        # límite de parámetros SQLite
+                chunk = uniq[i:i + 500]
+                rows = self._db.execute(
+                    f"SELECT key, row FROM emb_index WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._db.executemany("UPDATE emb_index SET accessed = ? WHERE key = ?",
+                                     [(now, k) for k in found])
+                self._db.commit()
+            mat = self._matrix()
+            out = {k: np.array(mat[r]) for k, r in found.items()}
+        self.hits   += sum(1 for k in keys if k in out)
+        self.misses += sum(1 for k in keys if k not in out)
+        return out
+
+    def put_many(self, keys: list[str], vecs: np.ndarray):
+        vecs = np.ascontiguousarray(vecs, dtype="float32")
+        with self._lock:
+            # primero los datos (y a disco), después el índice que los referencia
+            with open(self.vec_path, "ab") as f:
+                f.write(vecs.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            start = self._rows
+            self._rows += len(keys)
+            now = time.time()
+            self._db.executemany("INSERT OR REPLACE INTO emb_index VALUES (?, ?, ?)",
+                                 [(k, start + i, now) for i, k in enumerate(keys)])
+            self._db.commit()
+            live = self._db.execute("SELECT COUNT(*) FROM emb_index").fetchone()[0]
+            if live > self.max_rows:
+                self._db.execute(
+                    "DELETE FROM emb_index WHERE key IN "
+                    "(SELECT key FROM emb_index ORDER BY accessed LIMIT ?)",
+                    (live - int(self.max_rows * 0.9),))
+                self._db.commit()
+                live = int(self.max_rows * 0.9)
+            if self._rows - live > live:
+                self._compact()
+
+    def _compact(self):
+        """Reescribe el fichero solo con las filas vivas (bajo el lock)."""
+        rows = self._db.execute("SELECT key, row FROM emb_index ORDER BY row").fetchall()
+        mat = self._matrix()
+        new_path = self._vec_path(self._gen + 1)
+        with open(new_path, "wb") as f:
+            for i in range(0, len(rows), 10_000):
+                f.write(np.ascontiguousarray(
+                    mat[[r for _, r in rows[i:i + 10_000]]]).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        # filas renumeradas + generación nueva en una sola transacción
+        self._db.executemany("UPDATE emb_index SET row = ? WHERE key = ?",
+                             [(i, k) for i, (k, _) in enumerate(rows)])
+        self._db.execute("UPDATE emb_meta SET gen = ?", (self._gen + 1,))
+        self._db.commit()
+        del mat                       # suelta el memmap antes de borrar (Windows)
+        self._mm = None
+        old, self.vec_path, self._gen = self.vec_path, new_path, self._gen + 1
+        old.unlink(missing_ok=True)
+        self._rows = len(rows)
+        log.info("EmbeddingCache: compactado a %d filas", self._rows)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "rows": self._rows}
+
+
+class EmbeddingService:
+    def __init__(self, model: str = EMBEDDING_MODEL,
+                 dimensions: int | None = None,
+                 concurrency: int = EMBED_CONCURRENCY):
+        self.model       = model
+        self.dimensions  = dimensions
+        self.concurrency = max(1, concurrency)
+        self._enc        = None
+        self._cache: EmbeddingCache | None = None
+
+    @property
+    def cache(self) -> EmbeddingCache | None:
+        """Caché en disco del modelo/dimensión (None si está desactivada)."""
+        dim = self.dimensions or _MODEL_DIMS.get(self.model)
+        if self._cache is None and EMBED_CACHE and dim:
+            self._cache = EmbeddingCache(self.model, dim)
+        return self._cache
+
+    @property
+    def encoder(self):
+        """Codificador tiktoken del modelo (carga perezosa)."""
+        if self._enc is None:
+            try:
+                self._enc = tiktoken.encoding_for_model(self.model)
+            except KeyError:
+                self._enc = tiktoken.get_encoding("cl100k_base")
+        return self._enc
+
+    def _prepare(self, texts: list[str]) -> tuple[list[str], list[int]]:
+        """Recorta textos largos; devuelve (textos, nº de tokens de cada uno)."""
+        out, counts = [], []
+        for t in texts:
+            t = (t or "").replace("\n", " ").strip() or " "   # la API rechaza ""
+            toks = self.encoder.encode(t, disallowed_special=())
+            if len(toks) > EMBED_MAX_TOKENS_PER_INPUT:
+                toks = toks[:EMBED_MAX_TOKENS_PER_INPUT]
+                t = self.encoder.decode(toks)
+            out.append(t)
+            counts.append(len(toks))
+        return out, counts
+
+    @staticmethod
+    def _batches(counts: list[int]) -> list[tuple[int, int]]:
+        """Parte [0, n) en rangos contiguos que respetan ambos límites."""
+        spans, start, tokens = [], 0, 0
+        for i, c in enumerate(counts):
+            if i > start and (i - start >= EMBED_MAX_INPUTS
+                              or tokens + c > EMBED_MAX_TOKENS_PER_REQUEST):
+                spans.append((start, i))
+                start, tokens = i, 0
+            tokens += c
+        if start < len(counts):
+            spans.append((start, len(counts)))
+        return spans
+
+    async def _request(self, inputs: list[str]) -> list[list[float]]:
+        kwargs = {"model": self.model, "input": inputs}
+        if self.dimensions:
+            kwargs["dimensions"] = self.dimensions
+        resp = await get_client().embeddings.create(**kwargs)
+        # la API indica la posición de cada vector; no confiamos en el orden
+        return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+
+    async def _fetch(self, inputs: list[str]) -> np.ndarray:
+        """Pide a la API los embeddings de `inputs` (lotes concurrentes)."""
+        inputs, counts = self._prepare(inputs)
+        spans = self._batches(counts)
+        sem = asyncio.Semaphore(self.concurrency)
+
+        async def _one(a: int, b: int):
+            async with sem:
+                return await self._request(inputs[a:b])
+
+        parts = await asyncio.gather(*(_one(a, b) for a, b in spans))
+        log.debug("EmbeddingService: %d textos en %d peticiones", len(inputs), len(spans))
+        return np.asarray([v for part in parts for v in part], dtype="float32")
+
+    async def embed(self, texts: list[str]) -> np.ndarray:
+        """Embeddings de `texts` en orden, como matriz float32 (n, dim)."""
+        texts = [t or "" for t in texts]
+        if not texts:
+            return np.zeros((0, self.dimensions or 0), dtype="float32")
+        cache = self.cache
+        if cache is None:
+            return await self._fetch(texts)
+
+        keys = [cache.key(t) for t in texts]
+        found = await asyncio.to_thread(cache.get_many, keys)
+        # textos nuevos, sin repetidos: cada uno se pide una sola vez
+        missing = {k: t for k, t in zip(keys, texts) if k not in found}
+        if missing:
+            vecs = await self._fetch(list(missing.values()))
+            await asyncio.to_thread(cache.put_many, list(missing), vecs)
+            found.update(zip(missing, vecs))
+        return np.stack([found[k] for k in keys]).astype("float32", copy=False)
+
+    async def embed_one(self, text: str) -> np.ndarray:
+        """Embedding de un único texto como vector float32 (dim,)."""
+        return (await self.embed([text]))[0]
+
+
+# instancia compartida por todos los agentes
+embedder = EmbeddingService()
@@ -6,7 +6,9 @@ enriquecido con un diccionario `data`.
 """
 from crewai import Agent
 from typing import ClassVar
-from openai import OpenAI
+from agents.llm import get_client, CHAT_MODEL
+from agents.cache import fingerprint
+from agents.prompt_budget import for_stage, stage_signature
 import json, logging
 
 log = logging.getLogger(__name__)
@@ -46,6 +48,33 @@ class ExtractAgent(Agent):
     name: ClassVar[str] = "extractor"
     description: ClassVar[str] = "Extrae campos estructurados y verifica coherencia"
 
+    # campos que añade la etapa y huella para la caché del orquestador
+    stage_fields: ClassVar[tuple[str, ...]] = ("data",)
+    stage_fingerprint: ClassVar[str] = fingerprint(
+        TEMPLATE, CHAT_MODEL, stage_signature("extract"))
+
+    # ─── petición / respuesta (compartidas con agents.batch) ───
+    def build_request(self, article: dict) -> dict:
+        """Argumentos de `chat.completions.create` para `article`."""
+        body = article.get("text") or article.get("summary", "")
+        body = for_stage(body, "extract")   # pasajes clave dentro del presupuesto
+        return {
+            "model": CHAT_MODEL,
+            "messages": [{"role": "user", "content": TEMPLATE.format(texto=body)}],
+            "response_format": {"type": "json_object"},
+        }
+
+    def parse_response(self, article: dict, content: str | None) -> dict:
+        try:
+            extracted = json.loads(content or "")
+        except json.JSONDecodeError:
+            log.warning("ExtractAgent: JSON inválido → %s", (content or "")[:80])
+            extracted = {}
+        if not isinstance(extracted, dict):
+            extracted = {}
+        article["data"] = extracted           # SIEMPRE dict, aunque sea vacío
+        return article
+
     # ─── ejecución ───
     async def run(self, *, article: dict):
         """
@@ -58,26 +87,5 @@ class ExtractAgent(Agent):
         dict
             El mismo artículo + {"data": {...}}
         """
-        body = article.get("text") or article.get("summary", "")
-        body = body[:6000]   # límite de tokens razonable
-
-        prompt = TEMPLATE.format(texto=body)
-        client = OpenAI()    # api_key via variable de entorno
-
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"}
-        )
-        try:
-            extracted = resp.choices[0].message.json()        # objeto dict
-        except AttributeError:                                # vino como str
-            raw = resp.choices[0].message.content
-            try:
-                extracted = json.loads(raw)
-            except json.JSONDecodeError:
-                log.warning("ExtractAgent: JSON inválido → %s", raw[:80])
-                extracted = {}
-
-        article["data"] = extracted           # SIEMPRE dict, aunque sea vacío
-        return article
+        resp = await get_client().chat.completions.create(**self.build_request(article))
+        return self.parse_response(article, resp.choices[0].message.content)
@@ -0,0 +1,177 @@
+# agents/fetch.py
+"""
+Descarga de artículos
+─────────────────────
+Único punto por el que pasan las descargas de cuerpos de noticia
+(WebSearchAgent y SummarizerAgent): primero se consulta `ArticleStore` y
+solo si la URL no está, o su entrada caducó, se descarga y parsea.
+Repetir una búsqueda sobre fechas solapadas apenas hace peticiones HTTP de
+artículos.
+
+• La red va por un cliente httpx asíncrono compartido (keep‑alive, límites
+  vía entorno): una descarga en espera no ocupa ningún hilo.
+• El parseo de HTML (newspaper3k + lxml, CPU puro) se envía a un pool de
+  procesos del tamaño de los núcleos, fuera del GIL del proceso principal.
+• Una entrada caducada con ETag / Last‑Modified se revalida con una
+  petición condicional: un 304 la renueva sin descargar ni parsear.
+• Cortesía por dominio (`HostScheduler`): tope de conexiones y de ritmo por
+  host, y retroceso solo para el host que responde 429/503.  Una espera
+  mayor que `FETCH_MAX_BACKOFF` se da por fallo en lugar de bloquear.
+• Si el texto estático es demasiado corto (medios que montan la noticia con
+  JavaScript) se renderiza la página con `agents.render` y se reparsea.
+• Con `OCR_ENABLED=1` el texto de las imágenes principales (`agents.ocr`)
+  se añade al cuerpo antes de guardarlo.
+"""
+import asyncio, logging, os, threading, urllib.parse
+from concurrent.futures import ProcessPoolExecutor
+import httpx
+from newspaper import Article
+from agents.cache import ArticleStore
+from agents.http import get_http_client
+from agents.ratelimit import HostScheduler, parse_retry_after
+from agents.render import needs_render, render_html
+from agents.ocr import OCR_ENABLED, ocr_images
+
+log = logging.getLogger(__name__)
+
+# descargas de cuerpos de artículo simultáneas
+FETCH_CONCURRENCY     = int(os.getenv("FETCH_CONCURRENCY", "8"))
+FETCH_MAX_CONNECTIONS = int(os.getenv("FETCH_MAX_CONNECTIONS", "100"))
+FETCH_MAX_KEEPALIVE   = int(os.getenv("FETCH_MAX_KEEPALIVE", "20"))
+FETCH_TIMEOUT         = float(os.getenv("FETCH_TIMEOUT", "20"))
+FETCH_CONNECT_TIMEOUT = float(os.getenv("FETCH_CONNECT_TIMEOUT", "10"))
+FETCH_UA              = os.getenv("FETCH_USER_AGENT",
+                                  "Mozilla/5.0 (compatible; centrus-multi/1.0)")
+# cortesía por dominio
+FETCH_HOST_CONCURRENCY = int(os.getenv("FETCH_HOST_CONCURRENCY", "4"))
+FETCH_HOST_RATE        = float(os.getenv("FETCH_HOST_RATE", "2"))     # peticiones/s
+FETCH_RETRIES          = int(os.getenv("FETCH_RETRIES", "3"))
+FETCH_MAX_BACKOFF      = float(os.getenv("FETCH_MAX_BACKOFF", "30"))  # s
+# procesos para parsear HTML (0 → nº de núcleos)
+PARSE_PROCESSES       = int(os.getenv("PARSE_PROCESSES", "0")) or os.cpu_count() or 1
+
+article_store = ArticleStore()
+_scheduler    = HostScheduler(FETCH_HOST_RATE, FETCH_HOST_CONCURRENCY,
+                              max_backoff=FETCH_MAX_BACKOFF)
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _parse_pool() -> ProcessPoolExecutor:
+    """Pool de procesos para el parseo, creado la primera vez que se usa."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PARSE_PROCESSES)
+        return _pool
+
+
+def _parse(url: str, html: str) -> dict:
+    """Extrae texto, título, fecha e imágenes principales del HTML (en el pool)."""
+    art = Article(url, language="es")
+    art.download(input_html=html); art.parse()
+    # imagen destacada + las del cuerpo de la nota, sin repetir
+    body = art.top_node.xpath(".//img/@src") if art.top_node is not None else []
+    images = [urllib.parse.urljoin(url, src)
+              for src in dict.fromkeys([art.top_image, *body]) if src]
+    return {"text": art.text, "title": art.title, "images": images,
+            "published": art.publish_date.isoformat() if art.publish_date else None}
+
+
+def _client() -> httpx.AsyncClient:
+    return get_http_client(
+        "articles",
+        limits=httpx.Limits(max_connections=FETCH_MAX_CONNECTIONS,
+                            max_keepalive_connections=FETCH_MAX_KEEPALIVE),
+        timeout=httpx.Timeout(FETCH_TIMEOUT, connect=FETCH_CONNECT_TIMEOUT),
+        headers={"User-Agent": FETCH_UA},
+        follow_redirects=True,
+    )
+
+
+async def _get(url: str, headers: dict) -> httpx.Response:
+    """GET por el planificador del host, con retroceso ante 429/503 y errores de red."""
+    host = httpx.URL(url).host
+    for attempt in range(FETCH_RETRIES + 1):
+        last = attempt == FETCH_RETRIES
+        async with _scheduler.slot(host):
+            try:
+                r = await _client().get(url, headers=headers)
+            except httpx.TransportError:
+                if last:
+                    raise
+                _scheduler.backoff(host)
+                continue
+        if r.status_code not in (429, 503):
+            _scheduler.ok(host)
+            return r
+        delay = _scheduler.backoff(host, parse_retry_after(r.headers.get("retry-after")))
+        if last or delay > FETCH_MAX_BACKOFF:
+            return r                       # no merece la pena esperar tanto
+        log.info("fetch: %s respondió %d, retroceso de %.1fs", host, r.status_code, delay)
+
+
+async def _download(url: str, stored: dict | None) -> dict:
+    """Descarga (condicional si hay validadores) y parsea en el pool."""
+    headers = {}
+    if stored is not None:
+        if stored["etag"]:
+            headers["If-None-Match"] = stored["etag"]
+        if stored["last_modified"]:
+            headers["If-Modified-Since"] = stored["last_modified"]
+    r = await _get(url, headers)
+    if r.status_code == 304 and stored is not None:
+        article_store.touch(url)
+        return stored
+    r.raise_for_status()
+
+    loop = asyncio.get_running_loop()
+    art = await loop.run_in_executor(_parse_pool(), _parse, url, r.text)
+    if needs_render(art["text"]):
+        async with _scheduler.slot(httpx.URL(url).host):
+            html = await render_html(url)
+        if html:
+            rendered = await loop.run_in_executor(_parse_pool(), _parse, url, html)
+            if len(rendered["text"]) > len(art["text"]):
+                art = rendered
+    if OCR_ENABLED and art["images"]:
+        extra = await ocr_images(art["images"], _get)
+        if extra:
+            art["text"] = f'{art["text"]}\n\n{extra}'.strip()
+    if art["text"]:
+        article_store.put(url, art["text"], art["title"], art["published"],
+                          etag=r.headers.get("etag"),
+                          last_modified=r.headers.get("last-modified"))
+    return art
+
+
+async def get_article(url: str) -> dict:
+    """{"text", "title", "published"} de `url`, desde el almacén o la red."""
+    stored = article_store.get(url)
+    if stored is not None and not stored["stale"]:
+        return stored
+    return await _download(url, stored)
+
+
+async def fetch_article(url: str) -> str:
+    """Texto del artículo (lanza la excepción si la descarga falla)."""
+    return (await get_article(url))["text"]
+
+
+async def fetch_articles(urls: list[str], concurrency: int | None = None) -> list[str | None]:
+    """
+    Descarga varios cuerpos a la vez (como mucho `concurrency`).  None si la
+    descarga falla, para distinguirla de un artículo sin texto.
+    """
+    sem = asyncio.Semaphore(max(1, concurrency or FETCH_CONCURRENCY))
+
+    async def _one(url: str) -> str:
+        async with sem:
+            try:
+                return await fetch_article(url)
+            except Exception as e:
+                log.warning("No se pudo extraer %s: %s", url, e)
+                return None
+
+    return list(await asyncio.gather(*(_one(u) for u in urls)))
@@ -0,0 +1,149 @@
+# agents/fused.py
+"""
+FusedAgent
+──────────
+Resumen + extracción + clasificación en UNA sola llamada al modelo.
+
+• El cuerpo del artículo se envía una vez (en lugar de tres) y se ahorran
+  dos viajes de ida y vuelta por artículo.
+• Salida estructurada (`response_format` = json_schema estricto): el modelo
+  no puede omitir campos ni devolver JSON mal formado.
+• Produce los mismos campos que el camino de tres agentes (`text`,
+  `summary`, `data`, `score`, `justificacion`), así que el resto del
+  pipeline (geo, RAG, tabla) no distingue de qué modo vino el registro.
+"""
+from crewai import Agent
+from typing import ClassVar
+from agents.llm import get_client, CHAT_MODEL
+from agents.cache import fingerprint
+from agents.prompt_budget import for_stage, stage_signature
+from agents.fetch import fetch_article
+from agents.classify import BAROMETRO
+import json, logging
+
+log = logging.getLogger(__name__)
+
+# escala del barómetro sin las instrucciones de formato de ClassifyAgent
+ESCALA = BAROMETRO.split("INSTRUCCIONES")[0].strip()
+
+FUSED_PROMPT = """
+Analiza la noticia siguiente sobre un posible desastre en México y devuelve
+en un único JSON:
+
+1. "summary": resumen en 3‑5 frases de los hechos clave, en español formal,
+   sin inventar datos.
+2. "data": campos estructurados
+   - "fecha": fecha del desastre (o descubrimiento) como YYYY-MM-DD
+   - "lugar": "País, Estado, Municipio, Región" (ubicación principal)
+   - "tipo_desastre": inundación | sismo | huracán | incendio forestal | ...
+   - "afectados": número aproximado de personas afectadas
+   - "muertes_confirmadas": número, o "0" si no hay
+   - "fuente_verificada": ¿la fuente menciona confirmación oficial?
+   Razona internamente para que los campos sean coherentes entre sí.
+3. "score": gravedad, un ENTERO de la escala:
+{escala}
+4. "justificacion": motivo del score en ≤25 palabras.
+
+Noticia:
+\"\"\"{texto}\"\"\"
+"""
+
+_DATA_FIELDS = ("fecha", "lugar", "tipo_desastre", "afectados", "muertes_confirmadas")
+
+SCHEMA = {
+    "name": "analisis_noticia",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "additionalProperties": False,
+        "required": ["summary", "data", "score", "justificacion"],
+        "properties": {
+            "summary": {"type": "string"},
+            "data": {
+                "type": "object",
+                "additionalProperties": False,
+                "required": [*_DATA_FIELDS, "fuente_verificada"],
+                "properties": {
+                    **{f: {"type": "string"} for f in _DATA_FIELDS},
+                    "fuente_verificada": {"type": "boolean"},
+                },
+            },
+            "score": {"type": "integer"},
+            "justificacion": {"type": "string"},
+        },
+    },
+}
+
+
+class FusedAgent(Agent):
+    role: str = "Analista integral de noticias"
+    goal: str = "Resumir, estructurar y valorar cada noticia en un solo paso"
+    backstory: str = (
+        "Periodista y analista humanitario que resume noticias de desastres, "
+        "extrae sus datos clave y valora su gravedad con el barómetro."
+    )
+
+    name: ClassVar[str] = "fused"
+    description: ClassVar[str] = "Resume, extrae y clasifica en una llamada"
+
+    # campos que añade la etapa y huella para la caché del orquestador
+    stage_fields: ClassVar[tuple[str, ...]] = (
+        "text", "summary", "data", "score", "justificacion")
+    stage_fingerprint: ClassVar[str] = fingerprint(
+        FUSED_PROMPT, SCHEMA, CHAT_MODEL, stage_signature("fused"))
+
+    # ─── petición / respuesta (compartidas con agents.batch) ───
+    def build_request(self, article: dict) -> dict:
+        """Argumentos de `chat.completions.create` para `article` (con 'text')."""
+        return {
+            "model": CHAT_MODEL,
+            "messages": [{"role": "user", "content": FUSED_PROMPT.format(
+                escala=ESCALA, texto=for_stage(article["text"], "fused"))}],
+            "response_format": {"type": "json_schema", "json_schema": SCHEMA},
+        }
+
+    def parse_response(self, article: dict, content: str | None,
+                       refusal: str | None = None) -> dict:
+        try:
+            out = json.loads(content or "")
+        except json.JSONDecodeError:
+            # negativa del modelo (refusal) o respuesta truncada
+            log.warning("FusedAgent: respuesta no válida → %s",
+                        (content or refusal or "")[:80])
+            out = {}
+
+        score = out.get("score")
+        if not isinstance(score, int) or score < -5 or score > 5:
+            log.warning("FusedAgent: score fuera de rango/ausente: %s", score)
+            score = "N/D"
+
+        article.update({
+            "summary": (out.get("summary") or "").strip(),
+            "data": out.get("data") or {},
+            "score": score,
+            "justificacion": out.get("justificacion", "N/D"),
+        })
+        return article
+
+    async def run(self, *, article: dict):
+        """
+        Parameters
+        ----------
+        article : dict
+            Debe contener al menos 'url' y 'title'; usa 'text' si ya viene.
+        Returns
+        -------
+        dict
+            Mismo dict con 'text', 'summary', 'data', 'score', 'justificacion'.
+        """
+        full_text = article.get("text") or ""
+        if not full_text and not article.get("fetch_failed"):
+            try:
+                full_text = await fetch_article(article["url"])
+            except Exception as e:
+                log.warning("FusedAgent: no se pudo descargar %s: %s", article["url"], e)
+        article["text"] = full_text or article["title"]
+
+        resp = await get_client().chat.completions.create(**self.build_request(article))
+        msg = resp.choices[0].message
+        return self.parse_response(article, msg.content, getattr(msg, "refusal", None))
@@ -0,0 +1,82 @@
+# agents/gazetteer.py
+"""
+Gazetteer de México
+───────────────────
+Índice en memoria de estados y municipios (nombre normalizado sin acentos →
+coordenadas) que GeoAgent consulta antes de ir a Nominatim: los lugares que
+aparecen una y otra vez se resuelven en microsegundos y sin red.
+
+• Datos incluidos: `agents/data/gazetteer_mx.csv` con los 32 estados y los
+  municipios que más aparecen en la cobertura.  Para usar el catálogo
+  completo de INEGI basta con apuntar `GAZETTEER_PATH` a un CSV con las
+  mismas columnas (tipo, nombre, estado, lat, lon, alias separados por “|”).
+"""
+import csv, os, re, unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+import numpy as np
+
+GAZETTEER_PATH = Path(os.getenv("GAZETTEER_PATH",
+                                Path(__file__).parent / "data" / "gazetteer_mx.csv"))
+
+
+def normalize(text: str) -> str:
+    """minúsculas, sin acentos ni puntuación, espacios simples."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+
+@dataclass(frozen=True)
+class Place:
+    tipo: str          # "estado" | "municipio"
+    nombre: str
+    estado: str
+    lat: float
+    lon: float
+
+
+class Gazetteer:
+    def __init__(self, path: str | Path = GAZETTEER_PATH):
+        self.places: list[Place] = []
+        self.by_name: dict[str, list[Place]] = {}
+        with open(path, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                p = Place(row["tipo"], row["nombre"], row["estado"],
+                          float(row["lat"]), float(row["lon"]))
+                self.places.append(p)
+                names = [p.nombre, *filter(None, (row.get("alias") or "").split("|"))]
+                for n in names:
+                    self.by_name.setdefault(normalize(n), []).append(p)
+        self._coords = np.array([(p.lat, p.lon) for p in self.places], dtype=np.float32)
+
+    def state(self, name: str) -> Place | None:
+        """Entrada del estado `name` (nombre oficial o alias)."""
+        return next((p for p in self.by_name.get(normalize(name), [])
+                     if p.tipo == "estado"), None)
+
+    def nearest_states(self, coords: list[tuple[float, float]]) -> list[str]:
+        """
+        Estado del lugar del gazetteer más cercano a cada (lat, lon).  Los
+        puntos van por bloques: la matriz de distancias de cada bloque ocupa
+        ~1 M de celdas, sean cuantos sean los puntos.
+        """
+        if not coords:
+            return []
+        ref = self._coords
+        pts = np.asarray(coords, dtype=np.float32)
+        step = max(1, (1 << 20) // len(ref))
+        nearest = np.empty(len(pts), dtype=np.int64)
+        for start in range(0, len(pts), step):
+            block = pts[start:start + step]
+            # distancia euclídea en grados: suficiente para asignar estado
+            nearest[start:start + step] = (
+                (block[:, None, :] - ref[None, :, :]) ** 2).sum(-1).argmin(1)
+        return [self.places[i].estado for i in nearest]
+
+
+@lru_cache(maxsize=1)
+def get_gazetteer() -> Gazetteer:
+    """Instancia única, cargada la primera vez que se usa."""
+    return Gazetteer()
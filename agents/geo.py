@@ -12,22 +12,111 @@ GeoAgent
 • Geocodifica el campo `lugar` (si existe) de cada registro usando Nominatim‑OSM.
 • Si `lugar` falta, intenta extraer la primera entidad LOC del resumen con spaCy.
 • Añade lat/lon al registro.
-• Genera un mapa Folium y devuelve su ruta temporal.
+• Genera un mapa Folium y devuelve su HTML en memoria (sin ficheros
+  compartidos entre sesiones), con una caché LRU pequeña por conjunto de
+  registros geocodificados.  Según el nº de puntos
+  elige marcadores, agrupación (MarkerCluster) o mapa de calor por celdas,
+  más una capa agregada por estado (nº de noticias y severidad media), de
+  modo que el tamaño del HTML no crece sin límite.
+• Nominatim admite ~1 petición/s: todas las consultas comparten un cliente
+  httpx, pasan por un limitador por host y las idénticas se resuelven una
+  sola vez por ejecución (las simultáneas esperan a la primera).  El dict
+  de tareas en curso es de cada ejecución y se descarta al terminar.
+• Antes de Nominatim se consulta el gazetteer de estados/municipios de
+  México (solo si el lugar cita México o un estado) y la caché persistente
+  de geocodificación (con caché negativa).
+• El `lugar` jerárquico del extractor se resuelve primero con PlaceResolver
+  (coincidencia difusa contra el gazetteer): sin red y sin pasar por spaCy.
+• spaCy se carga la primera vez que hace falta, solo con el componente NER,
+  y todos los resúmenes pendientes pasan en un único `nlp.pipe` (con varios
+  procesos si `SPACY_PROCESSES` > 1 y el lote es grande).
 El agente es *defensivo*: ignora cualquier elemento que no sea dict o cuyo
 campo `data` no sea un diccionario.
 """
 from crewai import Agent
 from typing import ClassVar
-import spacy, httpx, folium, asyncio, tempfile, logging
-from pathlib import Path
+import httpx, folium, asyncio, logging, os, math, threading
+from collections import OrderedDict, defaultdict
+from folium.plugins import HeatMap, MarkerCluster
+from agents.http import get_http_client
+from agents.ratelimit import HostRateLimiter
+from agents.cache import GeocodeCache, fingerprint
+from agents.places import get_resolver
+from agents.gazetteer import get_gazetteer
 
 log = logging.getLogger(__name__)
 
-# ── carga única de spaCy (modelo mediano en español) ──
-try:
-    nlp = spacy.load("es_core_news_md")
-except OSError:
-    nlp = spacy.blank("es")
+NOMINATIM_URL  = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+NOMINATIM_RATE = float(os.getenv("NOMINATIM_RATE", "1.0"))     # peticiones/s
+# la política de uso de Nominatim exige identificar la aplicación
+NOMINATIM_UA   = os.getenv("NOMINATIM_USER_AGENT", "centrus-multi/1.0 (geocoding)")
+
+# modo de mapa: auto | markers | cluster | heatmap | states
+MAP_MODE        = os.getenv("MAP_MODE", "auto")
+MAP_MARKERS_MAX = int(os.getenv("MAP_MARKERS_MAX", "300"))    # auto: hasta aquí marcadores
+MAP_CLUSTER_MAX = int(os.getenv("MAP_CLUSTER_MAX", "2000"))   # auto: hasta aquí cluster
+HEAT_MAX_CELLS  = int(os.getenv("HEAT_MAX_CELLS", "3000"))    # celdas máx. del mapa de calor
+MAP_CACHE_SIZE  = int(os.getenv("MAP_CACHE_SIZE", "16"))      # mapas HTML en memoria
+
+SPACY_MODEL      = os.getenv("SPACY_MODEL", "es_core_news_md")
+SPACY_BATCH_SIZE = int(os.getenv("SPACY_BATCH_SIZE", "64"))
+SPACY_PROCESSES  = int(os.getenv("SPACY_PROCESSES", "1"))
+SPACY_MP_MIN     = int(os.getenv("SPACY_MP_MIN", "500"))      # lote mínimo para multiproceso
+
+_nominatim_limiter = HostRateLimiter(NOMINATIM_RATE)
+_geocode_cache     = GeocodeCache()
+
+
+# huella del conjunto de registros + modo → HTML del mapa (LRU)
+_map_cache: "OrderedDict[str, str]" = OrderedDict()
+_map_lock = threading.Lock()
+
+
+def _place_key(place: str) -> str:
+    return " ".join(place.casefold().split())
+
+# ── carga perezosa de spaCy (modelo mediano en español, solo NER) ──
+# pipeline_stream lanza muchos `to_thread(_first_locs, …)` a la vez: el modelo
+# se carga una sola vez y el NER va de uno en uno (un `nlp` no es seguro
+# entre hilos).
+_nlp = None
+_nlp_load_lock = threading.Lock()
+_ner_lock      = threading.Lock()
+
+
+def get_nlp():
+    global _nlp
+    with _nlp_load_lock:
+        if _nlp is None:
+            _nlp = _load_nlp()
+        return _nlp
+
+
+def _load_nlp():
+    import spacy                       # importar spaCy ya cuesta; solo si hace falta
+    try:
+        nlp = spacy.load(SPACY_MODEL)
+    except OSError:
+        return spacy.blank("es")
+    keep = {"ner"}
+    # si NER escucha al tok2vec compartido, éste debe seguir activo
+    if "tok2vec" in nlp.pipe_names and "ner" in getattr(
+            nlp.get_pipe("tok2vec"), "listening_components", []):
+        keep.add("tok2vec")
+    nlp.select_pipes(enable=[p for p in nlp.pipe_names if p in keep])
+    return nlp
+
+
+def _first_locs(texts: list[str]) -> list[str]:
+    """Primera entidad LOC de cada texto ("" si no hay), en un solo lote."""
+    nlp = get_nlp()
+    n_process = SPACY_PROCESSES if len(texts) >= SPACY_MP_MIN else 1
+    out = []
+    with _ner_lock:
+        for doc in nlp.pipe(texts, batch_size=SPACY_BATCH_SIZE, n_process=n_process):
+            locs = [e.text for e in doc.ents if e.label_ == "LOC"]
+            out.append(locs[0] if locs else "")
+    return out
 
 class GeoAgent(Agent):
     # ── metadatos obligatorios ──
@@ -40,77 +129,223 @@ class GeoAgent(Agent):
     description: ClassVar[str] = "Geocodifica lugares y crea mapa Folium"
 
     # ── función auxiliar asíncrona de geocodificación ──
-    async def _geocode(self, place: str):
-        """Devuelve (lat, lon) o (None, None) si falla."""
-        url = "https://nominatim.openstreetmap.org/search"
+    async def _nominatim(self, place: str):
+        """
+        Consulta Nominatim respetando el ritmo permitido.  Las respuestas
+        (incluida “sin resultados”) se guardan en la caché persistente; los
+        errores de red no, para reintentarlos en la siguiente ejecución.
+        """
+        client = get_http_client("nominatim", timeout=10,
+                                 headers={"User-Agent": NOMINATIM_UA})
+        await _nominatim_limiter.acquire(httpx.URL(NOMINATIM_URL).host)
         params = {"q": place, "format": "json", "limit": 1}
-        async with httpx.AsyncClient(timeout=10) as client:
-            try:
-                r = await client.get(url, params=params)
-                r.raise_for_status()
-                if r.json():
-                    j = r.json()[0]
-                    return float(j["lat"]), float(j["lon"])
-            except Exception as e:
-                log.warning("Nominatim error para '%s': %s", place, e)
-        return None, None
+        try:
+            r = await client.get(NOMINATIM_URL, params=params)
+            r.raise_for_status()
+            found = r.json()
+        except Exception as e:
+            log.warning("Nominatim error para '%s': %s", place, e)
+            return None, None
+        coords = (float(found[0]["lat"]), float(found[0]["lon"])) if found else (None, None)
+        _geocode_cache.put(place, *coords)
+        return coords
+
+    async def _geocode(self, place: str, inflight: dict | None = None):
+        """
+        Devuelve (lat, lon) o (None, None) si falla.  `inflight` (lugar
+        normalizado → tarea) es de la ejecución en curso: las consultas
+        idénticas comparten una sola petición a Nominatim.
+        """
+        # 1) gazetteer local y 2) caché persistente: sin red.  Solo se fía
+        # del gazetteer si el texto ancla el lugar en México: un "Mérida"
+        # suelto de una entidad NER puede ser el venezolano.
+        hit = get_resolver().resolve(place)
+        if hit is not None and hit.anchored:
+            return hit.place.lat, hit.place.lon
+        cached = _geocode_cache.get(place)
+        if cached is not None:
+            return cached
+
+        # 3) Nominatim, una sola vez por lugar y ejecución
+        if inflight is None:
+            return await self._nominatim(place)
+        key = _place_key(place)
+        if key not in inflight:                  # primera vez en esta ejecución
+            inflight[key] = asyncio.ensure_future(self._nominatim(place))
+        return await asyncio.shield(inflight[key])
+
+    @staticmethod
+    def _data(rec: dict) -> dict:
+        # asegura que rec["data"] sea dict (puede venir como str)
+        data = rec.get("data", {})
+        if not isinstance(data, dict):
+            log.warning("GeoAgent: 'data' no‑dict en registro '%s'", rec.get("title"))
+            data = {}
+        return data
+
+    # ── lugar a geocodificar para un registro (sin NER) ──
+    def _place_for(self, rec: dict) -> str:
+        data = self._data(rec)
+
+        # 1) ¿hay lugar en los datos extraídos?
+        partes = [data.get(k, "") for k in ("ciudad","municipio","estado","pais")]
+        lugar = ", ".join(p for p in partes if p).strip() or data.get("region","")
+        if not lugar and isinstance(data.get("lugar"), str):
+            lugar = data["lugar"].strip()
+        return lugar
+
+    # ── `lugar` del extractor resuelto localmente: ni red ni NER ──
+    def _resolve_local(self, rec: dict) -> bool:
+        lugar = self._data(rec).get("lugar")
+        match = get_resolver().resolve(lugar) if isinstance(lugar, str) else None
+        if match is None:
+            return False
+        rec["lat"], rec["lon"] = match.place.lat, match.place.lon
+        rec["estado"] = match.place.estado
+        return True
+
+    async def _assign(self, rec: dict, lugar: str, inflight: dict | None = None) -> dict:
+        rec["lat"], rec["lon"] = (await self._geocode(lugar, inflight)) if lugar else (None, None)
+        return rec
+
+    # ── geocodificación incremental (un registro) ──
+    async def locate(self, rec: dict, inflight: dict | None = None) -> dict:
+        """
+        Añade lat/lon a un único registro y lo devuelve.  Quien llama varias
+        veces en una misma ejecución pasa el mismo dict `inflight`.
+        """
+        if self._resolve_local(rec):
+            return rec
+        lugar = self._place_for(rec)
+        if not lugar:                                  # NER sobre el resumen
+            lugar = (await asyncio.to_thread(_first_locs, [rec.get("summary") or ""]))[0]
+        return await self._assign(rec, lugar, inflight)
+
+    # ── capas del mapa ──
+    @staticmethod
+    def _popup(rec: dict) -> str:
+        return f"{rec.get('title','')} (score {rec.get('score','?')})"
+
+    def _add_markers(self, target, points):
+        for rec in points:
+            folium.CircleMarker(location=[rec["lat"], rec["lon"]], radius=6,
+                                popup=self._popup(rec)).add_to(target)
+
+    @staticmethod
+    def _add_heatmap(fmap, points):
+        """Mapa de calor con los puntos sumados por celda (nº de celdas acotado)."""
+        cell = 0.05
+        while True:
+            cells = defaultdict(int)
+            for rec in points:
+                cells[(round(rec["lat"] / cell), round(rec["lon"] / cell))] += 1
+            if len(cells) <= HEAT_MAX_CELLS:
+                break
+            cell *= 2
+        HeatMap([[i * cell, j * cell, n] for (i, j), n in cells.items()],
+                name="Mapa de calor", radius=15).add_to(fmap)
+
+    @staticmethod
+    def _add_states(fmap, points):
+        """Capa agregada: un círculo por estado con nº de noticias y score medio."""
+        gaz = get_gazetteer()
+        sin_estado = [r for r in points if not r.get("estado")]
+        estados = dict(zip(map(id, sin_estado),
+                           gaz.nearest_states([(r["lat"], r["lon"]) for r in sin_estado])))
+        agg = defaultdict(list)
+        for rec in points:
+            agg[rec.get("estado") or estados[id(rec)]].append(rec.get("score"))
+
+        layer = folium.FeatureGroup(name="Por estado")
+        for estado, scores in agg.items():
+            st = gaz.state(estado)
+            if st is None:
+                continue
+            valid = [s for s in scores if isinstance(s, int)]
+            mean = sum(valid) / len(valid) if valid else None
+            color = ("gray" if mean is None else "darkred" if mean <= -3
+                     else "orange" if mean < 0 else "green")
+            folium.CircleMarker(
+                location=[st.lat, st.lon],
+                radius=6 + 3 * math.sqrt(len(scores)),
+                color=color, fill=True, fill_opacity=0.6,
+                popup=(f"{estado}: {len(scores)} noticias, severidad media "
+                       f"{'N/D' if mean is None else f'{mean:.1f}'}"),
+            ).add_to(layer)
+        layer.add_to(fmap)
+
+    def _map_mode(self, n: int, mode: str | None) -> str:
+        mode = (mode or MAP_MODE).lower()
+        if mode != "auto":
+            return mode
+        return ("markers" if n <= MAP_MARKERS_MAX
+                else "cluster" if n <= MAP_CLUSTER_MAX else "heatmap")
+
+    # ── mapa Folium ──
+    def build_map(self, records, mode: str | None = None) -> str:
+        """
+        Dibuja los registros ya geocodificados; devuelve el HTML del mapa.
+        `mode` = markers | cluster | heatmap | states | auto (por nº de puntos).
+        El mismo conjunto de puntos con el mismo modo se sirve de la caché.
+        """
+        points = [r for r in records if r.get("lat") is not None and r.get("lon") is not None]
+        mode = self._map_mode(len(points), mode)
+        key = fingerprint(mode, *((r["lat"], r["lon"], r.get("title"), r.get("score"),
+                                   r.get("estado")) for r in points))
+        with _map_lock:
+            if key in _map_cache:
+                _map_cache.move_to_end(key)
+                return _map_cache[key]
+
+        fmap = folium.Map(location=[23, -102], zoom_start=5, tiles="OpenStreetMap")
+
+        if mode == "markers":
+            self._add_markers(fmap, points)
+        elif mode == "cluster":
+            cluster = MarkerCluster(name="Noticias").add_to(fmap)
+            self._add_markers(cluster, points)
+        elif mode == "heatmap":
+            self._add_heatmap(fmap, points)
+        if mode != "markers" and points:
+            self._add_states(fmap, points)
+            folium.LayerControl().add_to(fmap)
+
+        html = fmap.get_root().render()
+        with _map_lock:
+            _map_cache[key] = html
+            while len(_map_cache) > MAP_CACHE_SIZE:
+                _map_cache.popitem(last=False)
+        return html
 
     # ── método principal ──
     async def run(self, *, records):
-        """records debe ser list[dict] o dict único; devuelve {"records", "map_path"}."""
+        """records debe ser list[dict] o dict único; devuelve {"records", "map_html"}."""
         # normaliza a lista de dicts
         if isinstance(records, dict):
             records = [records]
         elif not isinstance(records, list):
             records = list(records)
 
-        tasks, valid = [], []
-
+        valid = []
         for rec in records:
             if not isinstance(rec, dict):
                 log.warning("GeoAgent ignoró un item no‑dict: %r", rec)
                 continue
-
-            # asegura que rec["data"] sea dict (puede venir como str)
-            data = rec.get("data", {})
-            if not isinstance(data, dict):
-                log.warning("GeoAgent: 'data' no‑dict en registro '%s'", rec.get("title"))
-                data = {}
-
-            # 1) ¿hay lugar en los datos extraídos?
-            partes = [data.get(k, "") for k in ("ciudad","municipio","estado","pais")]
-            lugar = ", ".join(p for p in partes if p).strip() or data.get("region","")
-
-            #lugar = data.get("lugar", "").strip()
-
-            # 2) si no, intenta NER sobre summary
-            if not lugar:
-                doc = nlp(rec.get("summary", ""))
-                locs = [e.text for e in doc.ents if e.label_ == "LOC"]
-                lugar = locs[0] if locs else ""
-
-            # 3) agenda geocodificación (si hay lugar)
             valid.append(rec)
-            tasks.append(
-                self._geocode(lugar) if lugar
-                else asyncio.sleep(0, result=(None, None))
-            )
 
-        # geocodificar en paralelo
-        coords = await asyncio.gather(*tasks)
+        # 1) resolución local; 2) claves/lugar extraídos; 3) NER en un solo lote
+        pending = [rec for rec in valid if not self._resolve_local(rec)]
+        places  = [self._place_for(rec) for rec in pending]
+        need    = [i for i, p in enumerate(places) if not p]
+        if need:
+            found = await asyncio.to_thread(
+                _first_locs, [pending[i].get("summary") or "" for i in need])
+            for i, p in zip(need, found):
+                places[i] = p
 
-        # construir mapa Folium
-        fmap = folium.Map(location=[23, -102], zoom_start=5, tiles="OpenStreetMap")
-        for rec, (lat, lon) in zip(valid, coords):
-            rec["lat"], rec["lon"] = lat, lon
-            if lat is not None:
-                folium.CircleMarker(
-                    location=[lat, lon],
-                    radius=6,
-                    popup=f"{rec.get('title','')} (score {rec.get('score','?')})"
-                ).add_to(fmap)
-
-        tmp_path = Path(tempfile.gettempdir()) / "map.html"
-        fmap.save(tmp_path)
-
-        return {"records": records, "map_path": str(tmp_path)}
+        # geocodificar en paralelo (consultas idénticas, una sola vez)
+        inflight: dict = {}
+        await asyncio.gather(*(self._assign(rec, p, inflight)
+                               for rec, p in zip(pending, places)))
+
+        return {"records": records, "map_html": self.build_map(valid)}
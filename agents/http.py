@@ -0,0 +1,36 @@
+# agents/http.py
+"""
+Clientes httpx compartidos
+──────────────────────────
+Un `httpx.AsyncClient` por nombre y por event loop, reutilizado por todas
+las llamadas de ese tipo (geocodificación, descarga de artículos…) para
+aprovechar conexiones keep‑alive en lugar de abrir un cliente por petición.
+Como en `agents.llm`, se guarda uno por loop porque Streamlit crea un loop
+nuevo en cada `asyncio.run`, y por la misma razón quien lanza la ejecución
+llama a `aclose_all()` al terminar: los pools sujetan el loop y la clave
+débil nunca caería sola.
+"""
+import asyncio, weakref
+import httpx
+
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, httpx.AsyncClient]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_http_client(name: str, **kwargs) -> httpx.AsyncClient:
+    """
+    Cliente `name` del loop actual.  `kwargs` (timeout, headers, limits…)
+    solo se usan la primera vez que se crea en ese loop.
+    """
+    per_loop = _clients.setdefault(asyncio.get_running_loop(), {})
+    client = per_loop.get(name)
+    if client is None or client.is_closed:
+        client = per_loop[name] = httpx.AsyncClient(**kwargs)
+    return client
+
+
+async def aclose_all():
+    """Cierra todos los clientes del loop actual y suelta su entrada."""
+    for client in _clients.pop(asyncio.get_running_loop(), {}).values():
+        await client.aclose()
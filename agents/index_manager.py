@@ -0,0 +1,156 @@
+# agents/index_manager.py
+"""
+Gestor de índices FAISS
+───────────────────────
+• Todo índice empieza plano (búsqueda exacta, ideal para pocas noticias).
+• Al superar `ANN_THRESHOLD` vectores se migra de forma transparente a un
+  índice aproximado entrenado (IVF o HNSW).  Los vectores se reinsertan en
+  el mismo orden, así que el id FAISS i sigue apuntando al payload i.
+• `evaluate()` mide recall@k y latencia contra la búsqueda exacta para
+  varios valores de nprobe / efSearch y poder elegir la configuración.
+
+Uso rápido del informe sobre el índice guardado:
+    python -m agents.index_manager
+"""
+import logging, math, os, time
+import faiss, numpy as np
+
+log = logging.getLogger(__name__)
+
+ANN_THRESHOLD        = int(os.getenv("ANN_THRESHOLD", "50000"))
+ANN_KIND             = os.getenv("ANN_KIND", "hnsw").lower()      # "hnsw" | "ivf"
+IVF_NLIST            = int(os.getenv("IVF_NLIST", "0"))           # 0 → 4·√n
+IVF_NPROBE           = int(os.getenv("IVF_NPROBE", "16"))
+HNSW_M               = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "80"))
+HNSW_EF_SEARCH       = int(os.getenv("HNSW_EF_SEARCH", "64"))
+
+_METRICS = {"ip": faiss.METRIC_INNER_PRODUCT, "l2": faiss.METRIC_L2}
+
+
+def new_index(dim: int, metric: str = "ip"):
+    """Índice plano vacío ("ip" = producto interno/coseno, "l2" = euclídea)."""
+    return (faiss.IndexFlatIP(dim) if _METRICS[metric] == faiss.METRIC_INNER_PRODUCT
+            else faiss.IndexFlatL2(dim))
+
+
+def _flat_of(index):
+    """Índice plano con los mismos vectores (ground truth para evaluar)."""
+    flat = faiss.IndexFlat(index.d, index.metric_type)
+    for start in range(0, index.ntotal, 100_000):
+        flat.add(index.reconstruct_n(start, min(100_000, index.ntotal - start)))
+    return flat
+
+
+def configure(index, nprobe: int | None = None, ef_search: int | None = None):
+    """Aplica parámetros de búsqueda (no afecta a índices planos)."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = nprobe or IVF_NPROBE
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search or HNSW_EF_SEARCH
+    return index
+
+
+def migrate(index, kind: str | None = None):
+    """Reconstruye `index` como IVF o HNSW con los mismos ids y métrica."""
+    kind = (kind or ANN_KIND).lower()
+    n, d, metric = index.ntotal, index.d, index.metric_type
+    t0 = time.perf_counter()
+
+    if kind == "ivf":
+        nlist = IVF_NLIST or max(16, int(4 * math.sqrt(n)))
+        quantizer = faiss.IndexFlat(d, metric)
+        new = faiss.IndexIVFFlat(quantizer, d, nlist, metric)
+        # FAISS recomienda 30–256 puntos de entrenamiento por lista
+        sample = np.random.default_rng(0).choice(n, min(n, 256 * nlist), replace=False)
+        new.train(index.reconstruct_batch(np.sort(sample).astype("int64")))
+    elif kind == "hnsw":
+        new = faiss.IndexHNSWFlat(d, HNSW_M, metric)
+        new.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    else:
+        raise ValueError(f"ANN_KIND desconocido: {kind!r}")
+
+    for start in range(0, n, 100_000):              # mismo orden → mismos ids
+        new.add(index.reconstruct_n(start, min(100_000, n - start)))
+    if kind == "ivf":
+        new.make_direct_map()                       # habilita reconstruct (MMR)
+    configure(new)
+    log.info("index_manager: %d vectores migrados a %s en %.1fs",
+             n, kind.upper(), time.perf_counter() - t0)
+    return new
+
+
+def add(index, vecs: np.ndarray):
+    """
+    Añade `vecs` y devuelve el índice a usar desde ahora: el mismo, o uno
+    aproximado si el plano acaba de pasar el umbral.  Puede tardar (la
+    migración entrena y reinserta todo): desde código asíncrono, llamarla con
+    `asyncio.to_thread`.
+    """
+    index.add(np.ascontiguousarray(vecs, dtype="float32"))
+    if isinstance(index, faiss.IndexFlat) and index.ntotal >= ANN_THRESHOLD:
+        index = migrate(index)
+    return index
+
+
+def evaluate(index, queries: np.ndarray | None = None, k: int = 10,
+             n_queries: int = 200, params: list[int] | None = None) -> list[dict]:
+    """
+    Recall@k y latencia por consulta frente a la búsqueda exacta.
+
+    Si no se dan `queries` se toman vectores del propio índice.  `params`
+    son los valores de nprobe (IVF) o efSearch (HNSW) a probar; devuelve una
+    fila por valor con recall, latencia media/p95 en ms y la del índice plano.
+    """
+    if queries is None:
+        ids = np.random.default_rng(0).choice(index.ntotal, min(n_queries, index.ntotal),
+                                              replace=False)
+        queries = index.reconstruct_batch(np.sort(ids).astype("int64"))
+    queries = np.ascontiguousarray(queries, dtype="float32")
+    k = min(k, index.ntotal)
+
+    def _timed(ix):
+        lat, found = [], []
+        for q in queries:
+            t0 = time.perf_counter()
+            _, I = ix.search(q[None, :], k)
+            lat.append((time.perf_counter() - t0) * 1000)
+            found.append(I[0])
+        return np.array(found), np.array(lat)
+
+    flat = _flat_of(index)
+    truth, flat_lat = _timed(flat)
+
+    ivf = faiss.try_extract_index_ivf(index)
+    is_hnsw = hasattr(index, "hnsw")
+    if params is None:
+        params = [1, 4, 16, 64] if ivf is not None else [16, 32, 64, 128] if is_hnsw else [0]
+
+    rows = []
+    for p in params:
+        if ivf is not None:
+            configure(index, nprobe=p)
+        elif is_hnsw:
+            configure(index, ef_search=p)
+        found, lat = _timed(index)
+        recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+        rows.append({"param": p, f"recall@{k}": round(float(recall), 4),
+                     "ms_mean": round(float(lat.mean()), 3),
+                     "ms_p95": round(float(np.percentile(lat, 95)), 3),
+                     "flat_ms_mean": round(float(flat_lat.mean()), 3)})
+    configure(index)                                # vuelve a los valores por defecto
+    return rows
+
+
+if __name__ == "__main__":
+    from agents.index_store import IndexStore
+
+    stored = IndexStore().load(mmap=False)
+    if stored is None:
+        print("No hay índice guardado.")
+    else:
+        ix = stored["faiss_index"]
+        print(f"{type(ix).__name__}: {ix.ntotal} vectores, dim {ix.d}")
+        for row in evaluate(ix):
+            print(row)
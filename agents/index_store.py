@@ -0,0 +1,257 @@
+# agents/index_store.py
+"""
+IndexStore
+──────────
+Persistencia en disco del índice FAISS y sus payloads entre sesiones.
+
+    <raíz>/
+      CURRENT                 ← nombre de la versión vigente
+      v000007/
+        index.faiss           ← faiss.write_index
+        payloads.jsonl        ← un payload (Doc o texto de BD) por línea
+        offsets.npy           ← offset de inicio de cada línea (n + 1)
+        meta.json             ← formato, nº de vectores, dimensión, fecha
+
+• Cada `save()` escribe una versión nueva en un directorio temporal, la
+  renombra y solo entonces actualiza `CURRENT` con `os.replace`: un corte a
+  mitad de guardado deja intacta la versión anterior.
+• El directorio temporal es único por guardado, y la asignación del número
+  de versión, el cambio de `CURRENT` y la poda se hacen bajo un fichero de
+  bloqueo (`LOCK`): dos sesiones que guardan a la vez no se pisan.
+• `load()` abre el índice y los payloads mapeados en memoria (solo lectura):
+  arrancar con millones de vectores no los copia a RAM ni re‑embebe nada.
+  Antes de añadir vectores a un índice así hay que pasar por
+  `ensure_writable()` (RAGAgent y DBEmbedAgent ya lo hacen).
+"""
+import json, logging, mmap, os, shutil, time, uuid, weakref
+from contextlib import contextmanager
+from dataclasses import asdict
+from pathlib import Path
+import faiss, numpy as np
+from agents.cache import CACHE_DIR
+from agents.index_manager import configure
+
+log = logging.getLogger(__name__)
+
+INDEX_DIR      = Path(os.getenv("INDEX_DIR", CACHE_DIR / "index"))
+INDEX_KEEP     = int(os.getenv("INDEX_KEEP_VERSIONS", "2"))
+INDEX_LOCK_STALE = float(os.getenv("INDEX_LOCK_STALE", "60"))   # s; bloqueo abandonado
+FORMAT_VERSION = 1
+
+# índices abiertos con mmap: añadirles vectores abortaría el proceso
+_MMAPPED: "weakref.WeakSet" = weakref.WeakSet()
+
+
+def ensure_writable(index):
+    """Devuelve `index`, o una copia en memoria si está mapeado desde disco."""
+    if index is not None and index in _MMAPPED:
+        log.info("IndexStore: copiando índice mapeado a memoria para escribir")
+        # clone_index conservaría la vista sobre el fichero; serializar copia
+        return faiss.deserialize_index(faiss.serialize_index(index))
+    return index
+
+
+def _encode(item) -> dict:
+    if hasattr(item, "summary") and hasattr(item, "meta"):      # Doc
+        return {"doc": asdict(item)}
+    return {"text": str(item)}
+
+
+def _decode(obj: dict):
+    if "doc" in obj:
+        from agents.rag import Doc        # import diferido: rag importa este módulo
+        return Doc(**obj["doc"])
+    return obj["text"]
+
+
+class PayloadStore:
+    """
+    Secuencia de payloads respaldada por `payloads.jsonl` mapeado en memoria.
+    Cada elemento se decodifica al accederlo; los añadidos con `extend` o
+    `append` quedan en memoria hasta el siguiente `IndexStore.save()`.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.offsets = np.load(self.directory / "offsets.npy", mmap_mode="r")
+        self._file = open(self.directory / "payloads.jsonl", "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._tail: list = []
+
+    @property
+    def n_stored(self) -> int:
+        return len(self.offsets) - 1
+
+    def __len__(self):
+        return self.n_stored + len(self._tail)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if i >= self.n_stored:
+            return self._tail[i - self.n_stored]
+        a, b = int(self.offsets[i]), int(self.offsets[i + 1])
+        return _decode(json.loads(self._mm[a:b]))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def _rebase(self, directory: Path):
+        """Pasa a leer de `directory`, que ya contiene también los añadidos."""
+        fresh = PayloadStore(directory)
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._file.close()
+        self.directory, self.offsets = fresh.directory, fresh.offsets
+        self._file, self._mm = fresh._file, fresh._mm
+        self._tail = []
+
+    def append(self, item):
+        self._tail.append(item)
+
+    def extend(self, items):
+        self._tail.extend(items)
+
+
+class IndexStore:
+    def __init__(self, root: str | Path | None = None, keep: int = INDEX_KEEP):
+        self.root = Path(root or INDEX_DIR)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.keep = max(1, keep)
+
+    # ───────── utilidades ─────────
+    def current(self) -> str | None:
+        try:
+            return (self.root / "CURRENT").read_text().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _versions(self) -> list[str]:
+        return sorted(p.name for p in self.root.glob("v[0-9]*") if p.is_dir())
+
+    @contextmanager
+    def _locked(self):
+        """
+        Bloqueo entre procesos con un fichero creado en exclusiva (portable,
+        sin fcntl).  Solo cubre pasos cortos; un bloqueo más viejo que
+        `INDEX_LOCK_STALE` se considera de un proceso caído y se retira.
+        """
+        lock = self.root / "LOCK"
+        while True:
+            try:
+                fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - lock.stat().st_mtime > INDEX_LOCK_STALE:
+                        log.warning("IndexStore: retirando bloqueo abandonado %s", lock)
+                        lock.unlink(missing_ok=True)
+                        continue
+                except FileNotFoundError:
+                    continue
+                time.sleep(0.05)
+        try:
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            yield
+        finally:
+            lock.unlink(missing_ok=True)
+
+    @staticmethod
+    def _fsync(path: Path):
+        with open(path, "rb") as f:
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def _write_payloads(directory: Path, payloads):
+        """
+        Escribe payloads.jsonl + offsets.npy.  La parte ya guardada de un
+        PayloadStore se vuelca desde su mmap y no desde su ruta: la versión de
+        la que se cargó puede haber sido podada entretanto.
+        """
+        offsets = [0]
+        with open(directory / "payloads.jsonl", "wb") as f:
+            if isinstance(payloads, PayloadStore):
+                offsets = [int(o) for o in payloads.offsets]
+                f.write(memoryview(payloads._mm)[:offsets[-1]])
+                pending = payloads._tail
+            else:
+                pending = payloads
+            for item in pending:
+                line = json.dumps(_encode(item), ensure_ascii=False, default=str).encode("utf-8")
+                f.write(line + b"\n")
+                offsets.append(offsets[-1] + len(line) + 1)
+            f.flush()
+            os.fsync(f.fileno())
+        np.save(directory / "offsets.npy", np.asarray(offsets, dtype="int64"))
+
+    # ───────── API ─────────
+    def save(self, faiss_index, faiss_payloads) -> str:
+        """Guarda una versión nueva de forma atómica y devuelve su nombre."""
+        tmp = self.root / f".{os.getpid()}-{uuid.uuid4().hex[:8]}.tmp"
+        tmp.mkdir()
+        try:
+            faiss.write_index(faiss_index, str(tmp / "index.faiss"))
+            self._write_payloads(tmp, faiss_payloads if faiss_payloads is not None else [])
+            (tmp / "meta.json").write_text(json.dumps({
+                "format": FORMAT_VERSION, "ntotal": int(faiss_index.ntotal),
+                "dim": int(faiss_index.d), "saved_at": time.time(),
+            }))
+            for f in ("index.faiss", "offsets.npy", "meta.json"):
+                self._fsync(tmp / f)
+
+            with self._locked():
+                versions = self._versions()
+                name = f"v{int(versions[-1][1:]) + 1 if versions else 1:06d}"
+                os.replace(tmp, self.root / name)
+                pointer = self.root / "CURRENT.tmp"
+                pointer.write_text(name)
+                self._fsync(pointer)
+                os.replace(pointer, self.root / "CURRENT")
+                if isinstance(faiss_payloads, PayloadStore):
+                    faiss_payloads._rebase(self.root / name)
+                self._prune(name)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)     # solo si no llegó a renombrarse
+        log.info("IndexStore: guardada %s (%d vectores)", name, faiss_index.ntotal)
+        return name
+
+    def _prune(self, current: str):
+        old = [v for v in self._versions() if v != current]
+        for v in old[:max(0, len(old) - (self.keep - 1))]:
+            # en Windows puede fallar si otra sesión aún tiene la versión mapeada
+            shutil.rmtree(self.root / v, ignore_errors=True)
+
+    def load(self, mmap: bool = True) -> dict | None:
+        """{"faiss_index", "faiss_payloads"} de la versión vigente, o None."""
+        name = self.current()
+        if name is None or not (self.root / name).is_dir():
+            return None
+        d = self.root / name
+        meta = json.loads((d / "meta.json").read_text())
+        if meta.get("format") != FORMAT_VERSION:
+            log.warning("IndexStore: formato %s no soportado en %s", meta.get("format"), name)
+            return None
+
+        path = str(d / "index.faiss")
+        if not mmap:
+            index = faiss.read_index(path)
+        else:
+            flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+            try:
+                index = faiss.read_index(path, flags | getattr(faiss, "IO_FLAG_MMAP_IFC", 0))
+            except RuntimeError:
+                # las listas invertidas de un IVF no se pueden mapear así
+                index = faiss.read_index(path, flags)
+            _MMAPPED.add(index)
+        configure(index)                  # nprobe / efSearch según el entorno
+        payloads = PayloadStore(d)
+        if index.ntotal != len(payloads):
+            log.warning("IndexStore: %s tiene %d vectores y %d payloads",
+                        name, index.ntotal, len(payloads))
+        return {"faiss_index": index, "faiss_payloads": payloads}
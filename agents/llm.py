@@ -0,0 +1,54 @@
+# agents/llm.py
+"""
+Cliente OpenAI compartido
+─────────────────────────
+• Un único `AsyncOpenAI` por event loop para todos los agentes: las llamadas
+  ya no bloquean el loop y `asyncio.gather` solapa de verdad las esperas.
+• Pool httpx con conexiones keep‑alive; límites y timeouts vía entorno.
+• Se guarda uno por loop porque Streamlit crea un loop nuevo en cada
+  `asyncio.run` y un pool httpx no puede reutilizarse entre loops.
+• Las conexiones del pool guardan una referencia fuerte a su loop: la clave
+  débil nunca caería sola.  Quien lanza la ejecución llama a `aclose()` al
+  terminar (el orquestador lo hace en su `finally`).
+"""
+import asyncio, os, weakref
+import httpx
+from openai import AsyncOpenAI
+
+OPENAI_MAX_CONNECTIONS  = int(os.getenv("OPENAI_MAX_CONNECTIONS", "50"))
+OPENAI_MAX_KEEPALIVE    = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+OPENAI_TIMEOUT          = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_CONNECT_TIMEOUT  = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10"))
+OPENAI_MAX_RETRIES      = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+
+CHAT_MODEL      = "gpt-4o-mini"
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_client() -> AsyncOpenAI:
+    """Devuelve el cliente asíncrono del loop actual (lo crea la primera vez)."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS,
+                                max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                                keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY),
+            timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+        )
+        client = AsyncOpenAI(http_client=http,              # api_key vía entorno
+                             max_retries=OPENAI_MAX_RETRIES)
+        _clients[loop] = client
+    return client
+
+
+async def aclose():
+    """Cierra el cliente del loop actual y suelta su entrada (fin de ejecución)."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
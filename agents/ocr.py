@@ -0,0 +1,108 @@
+# agents/ocr.py
+"""
+OCR de imágenes de artículo
+───────────────────────────
+Etapa opcional (`OCR_ENABLED=1`) para boletines de protección civil e
+infografías que publican las cifras solo como imagen: el texto leído se
+añade al cuerpo del artículo antes de guardarlo, así ExtractAgent lo ve.
+
+• Solo las imágenes principales (la destacada y las del cuerpo de la nota),
+  como mucho `OCR_MAX_IMAGES` por artículo; los iconos pequeños se ignoran.
+• Cada imagen se pasa a escala de grises, se reduce a `OCR_MAX_SIDE` px y se
+  identifica por la huella de esos píxeles: la misma imagen servida desde
+  otra URL o en otro formato se reconoce una sola vez.
+• Decodificar y Tesseract corren en un pool de procesos (`OCR_PROCESSES`,
+  0 → nº de núcleos); el event loop nunca espera a la CPU.
+• El texto se guarda por huella en `OCRCache`.
+"""
+import asyncio, hashlib, io, logging, os, threading
+from concurrent.futures import ProcessPoolExecutor
+from agents.cache import OCRCache
+
+log = logging.getLogger(__name__)
+
+OCR_ENABLED     = os.getenv("OCR_ENABLED", "0") == "1"
+OCR_MAX_IMAGES  = int(os.getenv("OCR_MAX_IMAGES", "4"))
+OCR_MAX_SIDE    = int(os.getenv("OCR_MAX_SIDE", "2000"))       # px, lado mayor
+OCR_MIN_SIDE    = int(os.getenv("OCR_MIN_SIDE", "300"))        # px; menos = icono
+OCR_MAX_BYTES   = int(os.getenv("OCR_MAX_BYTES", str(10 * 1024 * 1024)))
+OCR_LANG        = os.getenv("OCR_LANG", "spa")
+OCR_MIN_CHARS   = int(os.getenv("OCR_MIN_CHARS", "20"))        # menos = ruido
+OCR_PROCESSES   = int(os.getenv("OCR_PROCESSES", "0")) or os.cpu_count() or 1
+
+ocr_cache = OCRCache()
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _ocr_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=OCR_PROCESSES)
+        return _pool
+
+
+def _prepare(data: bytes) -> tuple[str, bytes] | None:
+    """(huella, PNG reducido en grises) o None si no sirve (en el pool)."""
+    from PIL import Image
+    try:
+        img = Image.open(io.BytesIO(data))
+        img.load()
+    except Exception:
+        return None
+    if min(img.size) < OCR_MIN_SIDE:
+        return None
+    img = img.convert("L")
+    img.thumbnail((OCR_MAX_SIDE, OCR_MAX_SIDE))
+    digest = hashlib.sha256(img.tobytes() + repr(img.size).encode()).hexdigest()
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return digest, buf.getvalue()
+
+
+def _tesseract(png: bytes) -> str:
+    """Texto de la imagen con Tesseract (en el pool)."""
+    import pytesseract
+    from PIL import Image
+    return pytesseract.image_to_string(Image.open(io.BytesIO(png)), lang=OCR_LANG).strip()
+
+
+async def ocr_images(urls: list[str], get) -> str:
+    """
+    Texto reconocido en las imágenes `urls`, una por párrafo.  `get` es la
+    corrutina de descarga de `agents.fetch` (respeta la cortesía por host).
+    """
+    loop = asyncio.get_running_loop()
+    pool = _ocr_pool()
+
+    async def _one(url: str) -> tuple[str, str] | None:
+        try:
+            r = await get(url, {})
+            r.raise_for_status()
+        except Exception as e:
+            log.info("ocr: no se pudo descargar %s: %s", url, e)
+            return None
+        if len(r.content) > OCR_MAX_BYTES:
+            return None
+        prepared = await loop.run_in_executor(pool, _prepare, r.content)
+        if prepared is None:
+            return None
+        digest, png = prepared
+        text = ocr_cache.get(digest)
+        if text is None:
+            try:
+                text = await loop.run_in_executor(pool, _tesseract, png)
+            except Exception as e:
+                log.warning("ocr: Tesseract falló en %s: %s", url, e)
+                return None
+            ocr_cache.put(digest, text)
+        return digest, text
+
+    found = await asyncio.gather(*(_one(u) for u in dict.fromkeys(urls[:OCR_MAX_IMAGES])))
+    texts = {}                               # huella → texto (sin duplicados)
+    for item in found:
+        if item is not None and len(item[1]) >= OCR_MIN_CHARS:
+            texts.setdefault(*item)
+    return "\n\n".join(texts.values())
@@ -0,0 +1,159 @@
+# agents/places.py
+"""
+PlaceResolver
+─────────────
+Resuelve el campo libre `lugar` del extractor ("País, Estado, Municipio,
+Región") contra el gazetteer de México sin red ni spaCy.
+
+• Parte la cadena jerárquica en fragmentos y descarta el país.  Si algún
+  fragmento nombra otro país o no coincide con nada, no resuelve: el lugar
+  puede ser un homónimo extranjero ("Córdoba, Argentina") y debe decidirlo
+  Nominatim.
+• Cada fragmento se compara, sin acentos ni mayúsculas, con nombres y alias
+  del gazetteer mediante un índice de trigramas (coeficiente de Dice), así
+  que tolera erratas y variantes ("Acapulco Gro", "municipio de Juchitan").
+• Un nombre completo que coincide tal cual gana a cualquier variante: el
+  prefijo se quita solo si lo que queda no es el país ni un estado a secas
+  ("Ciudad de México" no es "México").  Que una cadena de varias palabras
+  se parezca a un estado de una sola ("Guerrero Negro" ≠ Guerrero) exige
+  `PLACE_STATE_MIN_SCORE`.
+• Devuelve la coincidencia más específica y confiable: un municipio
+  coherente con el estado citado, o el estado si no hay municipio.
+  `anchored` indica si la cadena cita México o un estado; un municipio
+  suelto ("Mérida") puede no ser el mexicano.
+"""
+import os, re
+from collections import Counter
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from agents.gazetteer import Gazetteer, Place, get_gazetteer, normalize
+
+PLACE_MIN_SCORE       = float(os.getenv("PLACE_MIN_SCORE", "0.75"))
+# difusa: fragmento de más palabras que el nombre del estado candidato
+PLACE_STATE_MIN_SCORE = float(os.getenv("PLACE_STATE_MIN_SCORE", "0.9"))
+
+_COUNTRY = {"mexico", "mx", "republica mexicana", "estados unidos mexicanos"}
+# países que el modelo antepone a homónimos de municipios mexicanos
+_FOREIGN = {"argentina", "espana", "venezuela", "australia", "colombia", "chile", "peru",
+            "cuba", "guatemala", "honduras", "el salvador", "nicaragua", "costa rica",
+            "panama", "ecuador", "bolivia", "paraguay", "uruguay", "brasil",
+            "republica dominicana", "puerto rico", "filipinas", "canada",
+            "estados unidos", "estados unidos de america", "eeuu", "ee uu", "eua",
+            "usa", "us", "united states"}
+_EMPTY   = {"", "n d", "nd", "na", "n a", "desconocido", "no especificado", "none", "null"}
+# prefijos que el modelo suele anteponer al nombre propio
+_PREFIX  = re.compile(r"^(municipio|ciudad|puerto|localidad|estado|alcaldia|region|zona)( de(l)?)? ")
+
+
+@dataclass(frozen=True)
+class Resolution:
+    place: Place
+    score: float       # 0‥1, Dice de trigramas (1 = coincidencia exacta)
+    matched: str       # fragmento de `lugar` que coincidió
+    anchored: bool = False   # `lugar` cita México o un estado mexicano
+
+
+def _grams(text: str) -> set[str]:
+    text = f"  {text} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class PlaceResolver:
+    def __init__(self, gazetteer: Gazetteer | None = None,
+                 min_score: float = PLACE_MIN_SCORE,
+                 state_min_score: float = PLACE_STATE_MIN_SCORE):
+        self.gaz = gazetteer or get_gazetteer()
+        self.min_score = min_score
+        self.state_min_score = state_min_score
+        self._names = list(self.gaz.by_name)
+        self._name_grams = [_grams(n) for n in self._names]
+        self._postings: dict[str, list[int]] = {}
+        for i, grams in enumerate(self._name_grams):
+            for g in grams:
+                self._postings.setdefault(g, []).append(i)
+
+    def _only_state(self, name: str) -> bool:
+        return all(pl.tipo == "estado" for pl in self.gaz.by_name.get(name, ()))
+
+    def _variants(self, part: str) -> list[str]:
+        """`part` y, si aporta, `part` sin el prefijo ("municipio de …")."""
+        m = _PREFIX.match(part)
+        if m is None:
+            return [part]
+        stripped = part[m.end():]
+        if (not stripped or stripped in _COUNTRY
+                # "ciudad de X" no es el estado X; "estado de X" sí
+                or (m.group(1) != "estado" and stripped in self.gaz.by_name
+                    and self._only_state(stripped))):
+            return [part]
+        return [part, stripped]
+
+    def _matches(self, part: str) -> list[tuple[float, str]]:
+        """(score, nombre normalizado) de los nombres más parecidos a `part`."""
+        if part in self.gaz.by_name:                 # nombre completo tal cual
+            return [(1.0, part)]
+        out: dict[str, float] = {}
+        for v in self._variants(part):
+            if v in self.gaz.by_name:
+                out[v] = 1.0
+                continue
+            q, words = _grams(v), len(v.split())
+            shared = Counter(i for g in q for i in self._postings.get(g, ()))
+            for i, n in shared.most_common(10):
+                name = self._names[i]
+                score = 2 * n / (len(q) + len(self._name_grams[i]))
+                need = (self.state_min_score
+                        if words > len(name.split()) and self._only_state(name)
+                        else self.min_score)
+                if score >= need:
+                    out[name] = max(out.get(name, 0.0), score)
+        return sorted(((s, n) for n, s in out.items()), reverse=True)
+
+    def resolve(self, lugar: str) -> Resolution | None:
+        # "N/D" es un vacío, no dos fragmentos: se descarta antes de partir por "/"
+        parts = [normalize(p) for f in re.split(r"[,;|]", lugar or "")
+                 if normalize(f) not in _EMPTY for p in f.split("/")]
+        if any(p in _FOREIGN for p in parts):
+            return None
+        national = any(p in _COUNTRY for p in parts)
+        parts = [p for p in parts if p not in _EMPTY and p not in _COUNTRY]
+        if not parts:
+            return None
+        scored = {p: self._matches(p) for p in parts}
+        if not all(scored.values()):
+            return None                              # fragmento desconocido
+
+        # estados citados (el mejor candidato estatal de cada fragmento)
+        states: dict[str, Resolution] = {}
+        for part, matches in scored.items():
+            for score, name in matches:
+                st = [pl for pl in self.gaz.by_name[name] if pl.tipo == "estado"]
+                if st:
+                    r = Resolution(st[0], score, part)
+                    if r.place.estado not in states or states[r.place.estado].score < score:
+                        states[r.place.estado] = r
+                    break
+        if len(states) > 1:
+            states.pop("México", None)              # "México" suele ser el país
+
+        # municipio más confiable, coherente con los estados citados
+        best: Resolution | None = None
+        for part, matches in scored.items():
+            if any(r.matched == part and r.score == 1.0 for r in states.values()):
+                continue                             # el fragmento es un estado
+            for score, name in matches:
+                munis = [pl for pl in self.gaz.by_name[name] if pl.tipo == "municipio"
+                         and (not states or pl.estado in states)]
+                if len(munis) == 1 and (best is None or score > best.score):
+                    best = Resolution(munis[0], score, part)
+        if best is None and len(states) == 1:
+            best = next(iter(states.values()))
+        if best is None:
+            return None
+        return replace(best, anchored=national or bool(states))
+
+
+@lru_cache(maxsize=1)
+def get_resolver() -> PlaceResolver:
+    """Instancia única (construye el índice de trigramas la primera vez)."""
+    return PlaceResolver()
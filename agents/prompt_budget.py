@@ -0,0 +1,143 @@
+# agents/prompt_budget.py
+"""
+Presupuesto de prompt
+─────────────────────
+Sustituye el recorte fijo por caracteres (`texto[:7000]`) de las etapas LLM:
+cuenta tokens con `tiktoken` y, si el artículo no cabe en el presupuesto de
+la etapa, elige los pasajes más relevantes en lugar de cortar por el final.
+
+• El texto se parte en pasajes (párrafos; los largos, en grupos de frases).
+• Cada pasaje puntúa por vocabulario de desastres y afectaciones, cifras y
+  nombres de estados/municipios del gazetteer.  La entradilla (primer
+  pasaje) entra siempre: en prensa resume el qué, dónde y cuándo.
+• Los elegidos se devuelven en su orden original, con “[…]” donde se
+  omitió texto, hasta llenar el presupuesto de tokens.
+
+Presupuestos por etapa (tokens del artículo, sin contar instrucciones):
+PROMPT_BUDGET_SUMMARIZE, _EXTRACT, _CLASSIFY, _FUSED.
+"""
+import os, re
+from functools import lru_cache
+import tiktoken
+from agents.llm import CHAT_MODEL
+from agents.gazetteer import get_gazetteer, normalize
+
+# sube si cambia la forma de elegir pasajes: invalida la caché de etapas
+SELECTOR_VERSION = 1
+
+BUDGETS = {
+    stage: int(os.getenv(f"PROMPT_BUDGET_{stage.upper()}", default))
+    for stage, default in (("summarize", "1500"), ("extract", "1500"),
+                           ("classify", "1200"), ("fused", "1800"))
+}
+PASSAGE_MAX_TOKENS = int(os.getenv("PROMPT_PASSAGE_MAX_TOKENS", "160"))
+
+# raíces (sin acentos) de desastres, afectaciones y respuesta oficial
+_KEYWORDS = re.compile(r"\b(" + "|".join((
+    "inundac", "sismo", "terremoto", "temblor", "huracan", "tormenta", "ciclon",
+    "tromba", "lluvia", "granizad", "incendio", "deslave", "derrumbe", "desliza",
+    "sequia", "erupcion", "volcan", "tornado", "desbord", "crecida", "oleaje",
+    "damnificad", "afectad", "evacuad", "desplazad", "muert", "fallecid",
+    "victima", "herid", "lesionad", "desaparecid", "rescat", "albergu", "refugio",
+    "emergencia", "declaratoria", "proteccion civil", "alerta", "dano", "vivienda",
+    "perdida", "cenapred", "sedena", "plan dn",
+)) + r")\w*")
+_NUMBERS = re.compile(r"\b(\d[\d.,]*|mil|miles|millon\w*|cientos|centenar\w*|decenas|docenas)\b")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+
+@lru_cache(maxsize=1)
+def encoder():
+    """Codificador tiktoken del modelo de chat (carga perezosa)."""
+    try:
+        return tiktoken.encoding_for_model(CHAT_MODEL)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str) -> int:
+    return len(encoder().encode(text or "", disallowed_special=()))
+
+
+def truncate(text: str, max_tokens: int) -> str:
+    """Primeros `max_tokens` tokens de `text`."""
+    toks = encoder().encode(text or "", disallowed_special=())
+    return text if len(toks) <= max_tokens else encoder().decode(toks[:max_tokens])
+
+
+@lru_cache(maxsize=1)
+def _place_names() -> frozenset[str]:
+    # nombres cortos ("mx", "gro") darían demasiados falsos positivos
+    return frozenset(n for n in get_gazetteer().by_name if len(n) >= 4)
+
+
+def _passages(text: str) -> list[str]:
+    """Párrafos; los que pasan de PASSAGE_MAX_TOKENS, en grupos de frases."""
+    out = []
+    for para in (p.strip() for p in re.split(r"\n+", text)):
+        if not para:
+            continue
+        if count_tokens(para) <= PASSAGE_MAX_TOKENS:
+            out.append(para)
+            continue
+        chunk, used = [], 0
+        for sent in _SENTENCE.split(para):
+            n = count_tokens(sent)
+            if chunk and used + n > PASSAGE_MAX_TOKENS:
+                out.append(" ".join(chunk))
+                chunk, used = [], 0
+            chunk.append(sent)
+            used += n
+        if chunk:
+            out.append(" ".join(chunk))
+    return out
+
+
+def _score(passage: str) -> float:
+    norm = normalize(passage)
+    words = norm.split()
+    grams = {" ".join(words[i:i + k]) for k in (1, 2, 3) for i in range(len(words) - k + 1)}
+    places = len(grams & _place_names())
+    return (3 * len(_KEYWORDS.findall(norm))
+            + 2 * min(len(_NUMBERS.findall(norm)), 5)
+            + 2 * places)
+
+
+def select(text: str, budget: int) -> str:
+    """
+    `text` si cabe en `budget` tokens; si no, sus pasajes más relevantes en
+    orden original hasta llenar el presupuesto.
+    """
+    text = text or ""
+    if count_tokens(text) <= budget:
+        return text
+    passages = _passages(text)
+    costs = [count_tokens(p) for p in passages]
+    # la entradilla primero; después por puntuación y, a igualdad, por posición
+    order = [0] + sorted(range(1, len(passages)), key=lambda i: (-_score(passages[i]), i))
+
+    chosen, used = set(), 0
+    for i in order:
+        if used + costs[i] + 2 <= budget:            # +2 ≈ separador
+            chosen.add(i)
+            used += costs[i] + 2
+    if not chosen:                                   # ni la entradilla cabe
+        return truncate(passages[0], budget)
+
+    out, prev = [], -1
+    for i in sorted(chosen):
+        if i != prev + 1:
+            out.append("[…]")
+        out.append(passages[i])
+        prev = i
+    return "\n\n".join(out)
+
+
+def for_stage(text: str, stage: str) -> str:
+    """`select` con el presupuesto configurado para `stage`."""
+    return select(text, BUDGETS[stage])
+
+
+def stage_signature(stage: str) -> tuple:
+    """Parte de la huella de caché que depende del recorte de la etapa."""
+    return ("prompt_budget", SELECTOR_VERSION, BUDGETS[stage])
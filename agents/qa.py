@@ -7,10 +7,8 @@ QAAgent
 """
 from crewai import Agent
 from typing import ClassVar
-from openai import OpenAI
-import numpy as np
-
-client = OpenAI()
+from agents.llm import get_client, CHAT_MODEL
+from agents.embeddings import embedder
 
 QA_PROMPT = """
 Contexto:
@@ -34,15 +32,12 @@ class QAAgent(Agent):
 
     async def run(self, *, question: str,
                   faiss_index, faiss_payloads):
-        qvec = client.embeddings.create(
-            model="text-embedding-3-small",
-            input=question).data[0].embedding
-        D, I = faiss_index.search(
-            np.array([qvec], dtype="float32"), k=5)
+        qvec = await embedder.embed_one(question)
+        D, I = faiss_index.search(qvec[None, :], k=5)
         context = "\n\n".join(faiss_payloads[i] for i in I[0])
 
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
+        resp = await get_client().chat.completions.create(
+            model=CHAT_MODEL,
             messages=[{"role": "user",
                        "content": QA_PROMPT.format(context=context, q=question)}])
         return resp.choices[0].message.content.strip()
@@ -5,48 +5,45 @@ RAGAgent 2.0
 1. -- Construye (o amplía) un índice FAISS con embeddings OpenAI.
 2. -- Guarda metadatos (title, url, score…) junto al embedding.
 3. -- Expone un método `query()` que:
-      • Recupera los *k* documentos más próximos  
-      • Usa MMR (diversidad) para evitar repeticiones  
+      • Recupera de FAISS una lista corta de M candidatos
+      • Usa MMR (diversidad, vectorizado) sobre esos M para elegir *k*
       • Redacta la respuesta con historial de conversación
         para mantener un chat largo y coherente.
 """
 from crewai import Agent
 from typing import ClassVar
-from openai import OpenAI
-import faiss, numpy as np, json, logging, heapq
+from agents.llm import get_client, CHAT_MODEL
+from agents.embeddings import embedder
+from agents.index_store import ensure_writable
+from agents import index_manager
+import numpy as np, json, logging, heapq, os, asyncio
 from dataclasses import asdict, dataclass 
 
 
 log = logging.getLogger(__name__)
 
-#──── helpers ────────────────────────────────────────────
-def _embed(text: str, model: str = "text-embedding-3-small") -> list[float]:
-    """Devuelve el embedding OpenAI del texto."""
-    openai_client = OpenAI()                       # ← instancia local
-    return (
-        openai_client
-        .embeddings
-        .create(model=model, input=text)
-        .data[0]
-        .embedding
-    )
+RAG_CANDIDATES = int(os.getenv("RAG_CANDIDATES", "50"))     # M: lista corta de FAISS
+RAG_MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.5"))  # 1 = solo relevancia
 
+#──── helpers ────────────────────────────────────────────
 def mmr(query_vec, doc_vecs, top_k=5, lambda_=0.5):
-    """Maximal-Marginal-Relevance sobre vectores numpy."""
-    selected, idxs = [], list(range(len(doc_vecs)))
+    """
+    Maximal-Marginal-Relevance vectorizado.  Mantiene para cada candidato su
+    similitud máxima con los ya elegidos, de modo que cada paso cuesta un
+    único producto matriz‑vector (O(k·n·d) en total).
+    """
+    n = len(doc_vecs)
     sims = doc_vecs @ query_vec
-    while idxs and len(selected) < top_k:
-        if not selected:
-            i = int(np.argmax(sims[idxs]))
-            selected.append(idxs.pop(i))
-            continue
-        mmr_scores = []
-        for j in idxs:
-            diversity = max(np.dot(doc_vecs[j], doc_vecs[s]) for s in selected)
-            score = lambda_ * sims[j] - (1 - lambda_) * diversity
-            mmr_scores.append(score)
-        i = int(np.argmax(mmr_scores))
-        selected.append(idxs.pop(i))
+    max_sim = np.full(n, -np.inf, dtype=sims.dtype)
+    taken = np.zeros(n, dtype=bool)
+    selected = []
+    for _ in range(min(top_k, n)):
+        scores = sims if not selected else lambda_ * sims - (1 - lambda_) * max_sim
+        scores = np.where(taken, -np.inf, scores)
+        i = int(np.argmax(scores))
+        selected.append(i)
+        taken[i] = True
+        max_sim = np.maximum(max_sim, doc_vecs @ doc_vecs[i])
     return selected
 
 def _get_summary(item) -> str:
@@ -80,16 +77,18 @@ class RAGAgent(Agent):
     async def run(self, *, records: list[dict],
                   faiss_index=None, faiss_payloads: list[Doc] | None = None):
 
-        # 1) Embeddings de los resúmenes
-        vecs = [_embed(r["summary"]) for r in records]
-        dim  = len(vecs[0])
+        # 1) Embeddings de los resúmenes (peticiones por lotes)
+        vecs = await embedder.embed([r["summary"] for r in records])
+        dim  = vecs.shape[1]
 
         if faiss_index is None:
-            faiss_index = faiss.IndexFlatIP(dim)      # producto interno (== coseno)
+            faiss_index = index_manager.new_index(dim, "ip")   # producto interno (== coseno)
             faiss_payloads = []
+        faiss_index = ensure_writable(faiss_index)    # p. ej. cargado con mmap
 
         start_id = len(faiss_payloads)
-        faiss_index.add(np.array(vecs, dtype="float32"))
+        # migra a IVF/HNSW si crece: entrenar y reinsertar tarda, fuera del event loop
+        faiss_index = await asyncio.to_thread(index_manager.add, faiss_index, vecs)
         faiss_payloads.extend(
             [Doc(id=start_id+i, summary=r["summary"], meta=r)
              for i, r in enumerate(records)]
@@ -105,16 +104,21 @@ class RAGAgent(Agent):
                     faiss_index,
                     faiss_payloads: list[Doc],
                     history: list[dict] | None = None,
-                    k: int = 5) -> tuple[str, list[dict]]:
+                    k: int = 5,
+                    candidates: int | None = None,
+                    lambda_: float | None = None) -> tuple[str, list[dict]]:
 
         # Embedding de la pregunta
-        q_vec = np.array(_embed(question), dtype="float32")[None, :]
-        # Similaridad por producto interno
-        _, _ = faiss_index.search(q_vec, len(faiss_payloads))  # necesitamos doc_vecs
-        doc_vecs = faiss_index.reconstruct_n(0, len(faiss_payloads))
+        q_vec = (await embedder.embed_one(question))[None, :]
+        # Lista corta de M candidatos; solo esos vectores se reconstruyen
+        m = min(max(candidates or RAG_CANDIDATES, k), faiss_index.ntotal)
+        _, I = faiss_index.search(q_vec, m)
+        ids = I[0][I[0] >= 0].astype("int64")
+        doc_vecs = faiss_index.reconstruct_batch(ids)
 
         # MMR para variedad
-        best = mmr(q_vec[0], doc_vecs, top_k=k)
+        lam = RAG_MMR_LAMBDA if lambda_ is None else lambda_
+        best = [int(ids[j]) for j in mmr(q_vec[0], doc_vecs, top_k=k, lambda_=lam)]
 
         context = "\n\n".join(
             f"[{i+1}] {_get_summary(faiss_payloads[i])}" for i in best
@@ -130,9 +134,8 @@ class RAGAgent(Agent):
         messages.extend(chat_history[-4:])            # máx 4 turnos previos
         messages.append({"role": "user", "content": user_prompt})
 
-        client = OpenAI()
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
+        resp = await get_client().chat.completions.create(
+            model=CHAT_MODEL,
             messages=messages,
             temperature=0.2
         )
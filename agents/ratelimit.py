@@ -0,0 +1,97 @@
+# agents/ratelimit.py
+"""
+Limitador de ritmo por host
+───────────────────────────
+Reparte “turnos” separados al menos `1 / rate` segundos para cada host.
+No usa locks: reservar el turno no cede el control al loop, así que sirve
+igual con varios event loops sucesivos (Streamlit) y el ritmo se respeta
+también entre una ejecución y la siguiente.
+
+`HostScheduler`, encima del limitador, añade un tope de conexiones
+simultáneas por host y retroceso por host ante 429/503 (respetando
+`Retry-After`): los dominios distintos siguen descargándose en paralelo y
+solo espera el que pidió calma.
+"""
+import asyncio, time, weakref
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+
+
+class HostRateLimiter:
+    def __init__(self, rate: float):
+        """`rate` = peticiones por segundo permitidas para cada host."""
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next: dict[str, float] = {}
+
+    async def acquire(self, host: str):
+        """Espera hasta el siguiente turno libre de `host`."""
+        now  = time.monotonic()
+        slot = max(now, self._next.get(host, 0.0))
+        self._next[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def defer(self, host: str, seconds: float):
+        """Ningún turno de `host` antes de `seconds` segundos desde ahora."""
+        self._next[host] = max(self._next.get(host, 0.0), time.monotonic() + seconds)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Segundos de una cabecera Retry-After (número o fecha HTTP), o None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HostScheduler:
+    def __init__(self, rate: float, concurrency: int,
+                 base_backoff: float = 1.0, max_backoff: float = 30.0):
+        """
+        `rate` peticiones/s y `concurrency` conexiones simultáneas por host;
+        el retroceso sin Retry-After crece desde `base_backoff` hasta
+        `max_backoff` con cada 429/503 seguido del mismo host.
+        """
+        self.limiter      = HostRateLimiter(rate)
+        self.concurrency  = max(1, concurrency)
+        self.base_backoff = base_backoff
+        self.max_backoff  = max_backoff
+        self._strikes: dict[str, int] = {}
+        # los semáforos de asyncio quedan ligados a un loop: uno por loop
+        self._sems: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    @asynccontextmanager
+    async def slot(self, host: str):
+        """Hueco de conexión para `host`, respetando tope y ritmo."""
+        sems = self._sems.setdefault(asyncio.get_running_loop(), {})
+        sem = sems.get(host)
+        if sem is None:
+            sem = sems[host] = asyncio.Semaphore(self.concurrency)
+        async with sem:
+            await self.limiter.acquire(host)
+            yield
+
+    def backoff(self, host: str, retry_after: float | None = None) -> float:
+        """
+        Aplaza `host` tras un 429/503 y devuelve los segundos pedidos.  El
+        aplazamiento nunca pasa de `max_backoff`: un Retry-After enorme no
+        deja el host bloqueado para todo el proceso; quien llama decide con
+        el valor devuelto si abandona la petición.
+        """
+        n = self._strikes[host] = self._strikes.get(host, 0) + 1
+        delay = (retry_after if retry_after is not None
+                 else min(self.max_backoff, self.base_backoff * 2 ** (n - 1)))
+        self.limiter.defer(host, min(self.max_backoff, delay))
+        return delay
+
+    def ok(self, host: str):
+        """Respuesta normal de `host`: reinicia su retroceso."""
+        self._strikes.pop(host, None)
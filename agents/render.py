@@ -0,0 +1,145 @@
+# agents/render.py
+"""
+Renderizado con navegador
+─────────────────────────
+Plan B de `agents.fetch` para medios que montan la noticia con JavaScript:
+cuando la extracción estática devuelve menos de `RENDER_MIN_CHARS`
+caracteres se renderiza la página con Playwright (Chromium sin cabeza) y se
+vuelve a parsear el HTML resultante.
+
+• Un navegador persistente por event loop y un pool de contextos
+  reutilizables: cada página paga su renderizado, no el arranque de Chromium.
+• Se bloquean imágenes, fuentes, vídeo y dominios de publicidad/analítica;
+  solo interesa el DOM con el texto.
+• Playwright es opcional: si no está instalado el plan B queda desactivado.
+"""
+import asyncio, logging, os, weakref
+import httpx
+
+log = logging.getLogger(__name__)
+
+RENDER_ENABLED   = os.getenv("RENDER_ENABLED", "1") == "1"
+RENDER_MIN_CHARS = int(os.getenv("RENDER_MIN_CHARS", "500"))   # texto mínimo sin renderizar
+RENDER_CONTEXTS  = int(os.getenv("RENDER_CONTEXTS", "4"))      # páginas simultáneas
+RENDER_TIMEOUT   = float(os.getenv("RENDER_TIMEOUT", "20"))    # s por página
+RENDER_WAIT_TIMEOUT = float(os.getenv("RENDER_WAIT_TIMEOUT", "60"))  # s esperando contexto libre
+RENDER_UA        = os.getenv("FETCH_USER_AGENT",
+                             "Mozilla/5.0 (compatible; centrus-multi/1.0)")
+
+_BLOCKED_TYPES = {"image", "font", "media"}
+_BLOCKED_HOSTS = tuple(filter(None, os.getenv("RENDER_BLOCK_DOMAINS", ",".join((
+    "doubleclick.net", "googlesyndication.com", "googletagmanager.com",
+    "google-analytics.com", "googleadservices.com", "adservice.google.com",
+    "facebook.net", "scorecardresearch.com", "taboola.com", "outbrain.com",
+    "amazon-adsystem.com", "criteo.com", "chartbeat.com", "hotjar.com",
+))).split(",")))
+
+
+async def _block(route):
+    """Aborta recursos pesados o de publicidad; deja pasar el resto."""
+    req = route.request
+    host = httpx.URL(req.url).host
+    if req.resource_type in _BLOCKED_TYPES or host.endswith(_BLOCKED_HOSTS):
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+class _Browser:
+    """Navegador y pool de contextos de un event loop."""
+
+    def __init__(self):
+        self._pw = self._browser = None
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._created = 0
+        self._start_lock = asyncio.Lock()
+
+    async def _start(self):
+        async with self._start_lock:
+            if self._browser is None:
+                from playwright.async_api import async_playwright
+                self._pw = await async_playwright().start()
+                self._browser = await self._pw.chromium.launch(headless=True)
+
+    async def _context(self):
+        """Un contexto libre; crea otro si aún no se llegó a `RENDER_CONTEXTS`."""
+        if self._idle.empty() and self._created < RENDER_CONTEXTS:
+            self._created += 1              # reserva el hueco antes de ceder el loop
+            ctx = None
+            try:
+                ctx = await self._browser.new_context(user_agent=RENDER_UA,
+                                                      java_script_enabled=True)
+                await ctx.route("**/*", _block)
+                return ctx
+            except BaseException:
+                self._created -= 1
+                if ctx is not None:
+                    await ctx.close()
+                raise
+        # si los contextos no vuelven (navegador colgado) no se espera para siempre
+        return await asyncio.wait_for(self._idle.get(), RENDER_WAIT_TIMEOUT)
+
+    async def html(self, url: str) -> str:
+        await self._start()
+        ctx = await self._context()
+        page = None
+        try:
+            page = await ctx.new_page()
+            await page.goto(url, wait_until="domcontentloaded",
+                            timeout=RENDER_TIMEOUT * 1000)
+            try:                            # margen para el contenido diferido
+                await page.wait_for_load_state("networkidle", timeout=3000)
+            except Exception:
+                pass
+            return await page.content()
+        finally:
+            if page is not None:
+                await page.close()
+            self._idle.put_nowait(ctx)
+
+    async def close(self):
+        if self._browser is not None:
+            await self._browser.close()
+            await self._pw.stop()
+            self._browser = self._pw = None
+
+
+_browsers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _Browser]" = (
+    weakref.WeakKeyDictionary()
+)
+_available = RENDER_ENABLED
+
+
+def needs_render(text: str | None) -> bool:
+    """¿La extracción estática se quedó corta y el plan B está disponible?"""
+    return _available and len((text or "").strip()) < RENDER_MIN_CHARS
+
+
+async def render_html(url: str) -> str | None:
+    """HTML de `url` tras ejecutar su JavaScript, o None si no se pudo."""
+    global _available
+    if not _available:
+        return None
+    loop = asyncio.get_running_loop()
+    browser = _browsers.get(loop)
+    if browser is None:
+        browser = _browsers[loop] = _Browser()
+    try:
+        return await browser.html(url)
+    except ImportError:
+        log.warning("render: Playwright no está instalado; renderizado desactivado")
+        _available = False
+    except Exception as e:
+        if browser._browser is None:        # Chromium no arrancó (¿falta `playwright install`?)
+            log.warning("render: no se pudo lanzar el navegador (%s); renderizado desactivado", e)
+            _available = False
+        else:
+            log.warning("render: no se pudo renderizar %s: %s", url, e)
+    return None
+
+
+async def close():
+    """Cierra el navegador del loop actual (al terminar cada ejecución)."""
+    browser = _browsers.pop(asyncio.get_running_loop(), None)
+    if browser is not None:
+        await browser.close()
@@ -2,16 +2,21 @@
 """
 SummarizerAgent
 ───────────────
-1. Descarga el texto completo del artículo con `newspaper3k`.
+1. Usa el texto que ya trae el artículo (WebSearchAgent lo descarga) o, si
+   falta, lo obtiene de `agents.fetch` (almacén en disco o newspaper3k);
+   si tampoco hay, resume el título.
 2. Genera un resumen de 3‑5 frases usando GPT‑4o.
 3. Devuelve el artículo enriquecido con campos `text` y `summary`.
 """
 from crewai import Agent
 from typing import ClassVar
-from openai import OpenAI
-from newspaper import Article
-from tenacity import retry, stop_after_attempt, wait_exponential
-import asyncio
+from agents.llm import get_client, CHAT_MODEL
+from agents.cache import fingerprint
+from agents.prompt_budget import for_stage, stage_signature
+from agents.fetch import fetch_article
+import logging
+
+log = logging.getLogger(__name__)
 
 # prompt de resumen
 SUM_PROMPT = """
@@ -35,14 +40,39 @@ class SummarizerAgent(Agent):
     name: ClassVar[str] = "summarizer"
     description: ClassVar[str] = "Resume artículos"
 
-    # ─── utilidades ───
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=2))
-    def _get_article_text(self, url: str) -> str:
-        """Descarga y parsea el artículo, con reintentos exponenciales."""
-        art = Article(url, language="es")
-        art.download()
-        art.parse()
-        return art.text
+    # campos que añade la etapa y huella para la caché del orquestador
+    stage_fields: ClassVar[tuple[str, ...]] = ("text", "summary")
+    stage_fingerprint: ClassVar[str] = fingerprint(
+        SUM_PROMPT, CHAT_MODEL, stage_signature("summarize"))
+
+    # ─── petición / respuesta (compartidas con agents.batch) ───
+    def build_request(self, article: dict) -> dict:
+        """Argumentos de `chat.completions.create` para `article` (con 'text')."""
+        return {
+            "model": CHAT_MODEL,
+            "messages": [{
+                "role": "user",
+                "content": SUM_PROMPT.format(
+                    texto=for_stage(article["text"], "summarize"))
+            }],
+        }
+
+    def parse_response(self, article: dict, content: str | None) -> dict:
+        article["summary"] = (content or "").strip()
+        return article
+
+    async def full_text(self, article: dict) -> str:
+        """
+        Texto ya descargado o, si no lo hay, almacén / descarga; si no, el
+        título.  No reintenta una descarga que ya falló (`fetch_failed`).
+        """
+        full_text = article.get("text") or ""
+        if not full_text and not article.get("fetch_failed"):
+            try:
+                full_text = await fetch_article(article["url"])
+            except Exception as e:
+                log.warning("newspaper3k falló para %s: %s", article["url"], e)
+        return full_text or article["title"]
 
     async def run(self, *, article: dict):
         """
@@ -55,26 +85,9 @@ class SummarizerAgent(Agent):
         dict
             Mismo dict con campos 'text' y 'summary' añadidos.
         """
-        # 1) Descargar texto completo en hilo aparte
-        try:
-            full_text = await asyncio.to_thread(self._get_article_text,
-            article["url"])
-        except Exception as e:
-            self.logger.warning("newspaper3k falló para %s: %s",
-                            article["url"], e)
-        full_text = article["title"]
+        # 1) Texto ya descargado o, si no lo hay, almacén / descarga
+        article["text"] = await self.full_text(article)
 
-        # 2) Llamar al modelo para resumir
-        client = OpenAI()                       # api_key vía entorno
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{
-                "role": "user",
-                "content": SUM_PROMPT.format(texto=full_text[:7000])
-            }]
-        )
-        summary = resp.choices[0].message.content.strip()
-
-        # 3) Enriquecer registro y devolver
-        article.update({"text": full_text, "summary": summary})
-        return article
+        # 2) Llamar al modelo para resumir y enriquecer el registro
+        resp = await get_client().chat.completions.create(**self.build_request(article))
+        return self.parse_response(article, resp.choices[0].message.content)
@@ -2,13 +2,9 @@
 from crewai import Agent
 import os
 from typing import ClassVar
-import httpx, feedparser, urllib.parse, asyncio, datetime as dt, re, logging, io
+import httpx, feedparser, urllib.parse, datetime as dt, re, logging, io
 from bs4 import BeautifulSoup            # para fallback rápido
-from playwright.sync_api import sync_playwright
-import pytesseract
-from PIL import Image
-from newspaper import Article
-from tenacity import retry, wait_exponential, stop_after_attempt
+from agents.fetch import fetch_articles
 
 log = logging.getLogger(__name__)
 
@@ -17,14 +13,6 @@ GNEWS_API_KEY = os.getenv("GNEWS_API_KEY")
 if not GNEWS_API_KEY :
     raise RuntimeError("Configura GNEWS_API_KEY en .env o st.secrets")
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=2))
-def _download_text(url: str) -> str:
-    art = Article(url, language="es")
-    art.download(); art.parse()
-    return art.text
-
-async def fetch_article(url: str) -> str:
-    return await asyncio.to_thread(_download_text, url)
 
 class WebSearchAgent(Agent):
     role: str = "Rastreador GNews"
@@ -62,21 +50,20 @@ class WebSearchAgent(Agent):
             r.raise_for_status()
             items = r.json().get("articles", [])
 
-        results = []
-        for art in items:
-            try:
-                text = await fetch_article(art["url"])
-            except Exception as e:
-                log.warning("No se pudo extraer %s: %s", art["url"], e)
-                text = ""
+        # cuerpos en paralelo; el texto viaja con el registro y el resumidor
+        # lo reutiliza en lugar de volver a descargarlo.  Si la descarga
+        # falló se marca `fetch_failed` para que nadie la repita.
+        items = items[:n]
+        texts = await fetch_articles([art["url"] for art in items])
 
+        results = []
+        for art, text in zip(items, texts):
             results.append({
                 "title":  art["title"],
                 "url":    art["url"],
                 "date":   art["publishedAt"][:10],  # 2025-04-24T12:00:00Z -> 2025-04-24
                 "source": art["source"]["name"],
-                #"text":   text,
+                "text":   text,
+                "fetch_failed": text is None,
             })
-            if len(results) >= n:
-                break
-        return results
\ No newline at end of file
+        return results
@@ -8,7 +8,6 @@
 # ────────────────────────────────────────────────────────────────
 import os, asyncio, datetime as dt, urllib.parse, requests, pandas as pd
 import streamlit as st
-from pathlib import Path
 import pysqlite3               # ← wheel con SQLite ≥3.43
 import sys
 sys.modules["sqlite3"] = pysqlite3        # alias global
@@ -16,7 +15,7 @@ sys.modules["pysqlite3"] = pysqlite3      # (por si acaso)
 from dotenv import load_dotenv
 
 load_dotenv()
-from orchestrator import pipeline, add_database, qa_agent, rag_builder
+from orchestrator import pipeline, pipeline_stream, add_database, qa_agent, rag_builder
 # ───────── función auxiliar ─────────
 def mask_key(key: str | None, show: int = 4) -> str:
     """
@@ -53,7 +52,12 @@ NEWS_API_KEY = os.getenv("NEWS_API_KEY")
 GNEWS_API_KEY = os.getenv("GNEWS_API_KEY")
 
 # importa orquestador y helper para BD
-from orchestrator import pipeline, add_database, qa_agent, rag_builder
+from orchestrator import (pipeline, pipeline_stream, add_database, qa_agent,
+                          rag_builder, load_index, save_index, ask)
+
+# índice RAG persistido: se abre mapeado en memoria una vez por sesión
+if "rag" not in st.session_state:
+    st.session_state.rag = load_index()
 
 #──────────────────── textos ES/EN ────────────────────#
 TX_ES = {
@@ -178,23 +182,45 @@ if st.button(T["process_bt"], disabled=not sel):
                      date=df.loc[i,"Fecha"], source=df.loc[i,"Fuente"])
                 for i in sel]
         with st.spinner("⏳ Ejecutando agentes…"):
-            records, map_path, rag = asyncio.run(
-                pipeline(keywords=keywords, n=len(arts),
-                         date_from=date_from, date_to=date_to,
-                         question=None,
-                         progress_cb=lambda m: st.write(m))
-            )
-            st.session_state.results_df = pd.json_normalize(records, sep="_")
-            st.session_state.map_path   = map_path
-            st.session_state.rag        = rag   # diccionario con índice FAISS
+            status = st.empty()
+            table  = st.empty()
+
+            async def _run_stream():
+                # muestra cada registro en cuanto termina, sin esperar al lote
+                rows, final = [], None
+                async for ev in pipeline_stream(keywords=keywords, n=len(arts),
+                                                date_from=date_from, date_to=date_to,
+                                                question=None,
+                                                progress_cb=lambda m: st.write(m),
+                                                rag=st.session_state.get("rag")):
+                    if ev["type"] == "stage":
+                        status.caption(f"{ev['stage']} · {ev['record'].get('title', '')}")
+                    elif ev["type"] == "record":
+                        rows.append(ev["record"])
+                        table.dataframe(pd.json_normalize(rows, sep="_"),
+                                        use_container_width=True)
+                    elif ev["type"] == "done":
+                        final = ev
+                return final
+
+            final = asyncio.run(_run_stream())
+            status.empty()
+            table.empty()
+            st.session_state.results_df = pd.json_normalize(final["records"], sep="_")
+            st.session_state.map_html   = final["map_html"]
+            # diccionario con índice FAISS (None si no se indexó nada)
+            st.session_state.rag        = (final["rag"] if final["rag"]["faiss_index"]
+                                           is not None else None)
+            if st.session_state.rag is not None:
+                save_index(st.session_state.rag)
         st.success("Agentes finalizados.")
 
 #──────────────────── Mostrar resultados ────────────────#
 if st.session_state.get("results_df") is not None:
     st.subheader(T["results"])
     st.dataframe(st.session_state.results_df, use_container_width=True)
-    html_map = Path(st.session_state.map_path).read_text(encoding="utf-8")
-    st.components.v1.html(html_map, height=500, scrolling=False)
+    # HTML en memoria de esta sesión: los reruns no leen disco ni rehacen el mapa
+    st.components.v1.html(st.session_state.map_html, height=500, scrolling=False)
     st.download_button(T["download"],
                        st.session_state.results_df.to_csv(index=False, encoding="utf-8"),
                        file_name="resultados.csv", mime="text/csv")
@@ -214,6 +240,7 @@ if up:
             st.session_state.rag = asyncio.run(
                 add_database(new_df, base_rag)
             )
+            save_index(st.session_state.rag)
         st.success("Base añadida al índice.")
 
 # ───────── Preguntas RAG ─────────
@@ -229,12 +256,8 @@ iresp_disabled = not (q.strip() and st.session_state.get("rag"))
 
 if st.button("Responder", disabled=resp_disabled):
     answer, st.session_state.chat = asyncio.run(
-        rag_builder.query(
-            question        = q,
-            faiss_index     = st.session_state.rag["faiss_index"],
-            faiss_payloads  = st.session_state.rag["faiss_payloads"],
-            history         = st.session_state.get("chat", [])
-        )
+        ask(question=q, rag=st.session_state.rag,
+            history=st.session_state.get("chat", []))
     )
     st.write(answer)
 
@@ -7,21 +7,47 @@ from agents.search     import SearchAgent
 from agents.summarize  import SummarizerAgent
 from agents.extract    import ExtractAgent
 from agents.classify   import ClassifyAgent
+from agents.fused      import FusedAgent
 from agents.geo        import GeoAgent
 from agents.rag        import RAGAgent
 from agents.qa         import QAAgent
 from agents.websearch import WebSearchAgent
 from agents.db_embed import DBEmbedAgent
 from agents.rag import RAGAgent
+from agents.cache import StageCache, fingerprint
+from agents.batch import BatchRunner
+from agents.fetch import fetch_articles
+from agents.index_store import IndexStore
+from agents import render, llm, http
 
 
-import asyncio
+import asyncio, functools, inspect, os, logging
+
+log = logging.getLogger(__name__)
+
+# ── límites de concurrencia (configurables vía entorno) ──
+#   PIPELINE_CONCURRENCY  → máximo de llamadas simultáneas entre todas las etapas
+#   <ETAPA>_CONCURRENCY   → máximo por etapa (summarize / extract / classify / fused)
+MAX_CONCURRENCY = int(os.getenv("PIPELINE_CONCURRENCY", "8"))
+STAGE_CONCURRENCY = {
+    stage: int(os.getenv(f"{stage.upper()}_CONCURRENCY", MAX_CONCURRENCY))
+    for stage in ("summarize", "extract", "classify", "fused")
+}
+
+# modo de procesamiento por artículo:
+#   "agents" → resumen, extracción y clasificación con tres llamadas
+#   "fused"  → las tres cosas en una sola llamada con salida estructurada
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "agents")
+_MODES = {"agents": ("summarize", "extract", "classify"), "fused": ("fused",)}
+# en modo "agents", clasificar por lotes (varios resúmenes por petición)
+CLASSIFY_BATCH = os.getenv("CLASSIFY_BATCH", "0") == "1"
 
 # instancia única (puedes también instanciar cada vez)
 _search  = SearchAgent()
 _sum     = SummarizerAgent()
 _extract = ExtractAgent()
 _class   = ClassifyAgent()
+_fused   = FusedAgent()
 _geo     = GeoAgent()
 _rag     = RAGAgent()
 _qa      = QAAgent()
@@ -30,35 +56,200 @@ _db  = DBEmbedAgent()
 qa_agent = _qa
 rag_builder = RAGAgent()
 qa_agent    = QAAgent()
+stage_cache = StageCache()        # salidas por artículo, persistentes entre ejecuciones
+index_store = IndexStore()        # índice FAISS + payloads en disco, versionados
 
-async def pipeline(keywords: str, n: int,
-                   date_from=None, date_to=None,
-                   question: str | None = None,
-                   progress_cb=lambda msg: None):
-    """Devuelve (records, map_path, answer)."""
-    progress_cb("🔍 Paso 1· Buscando artículos (NewsAPI + GNews)…")
-    raw_news, raw_gnews = await asyncio.gather(
-    _search.run(keywords=keywords, n=n,
-                date_from=date_from, date_to=date_to),
-    _websearch.run(keywords=keywords, n=n,
-                   date_from=date_from, date_to=date_to)
-)
+# etapa → (agente, nombre del argumento que recibe el registro)
+_STAGES = {
+    "summarize": (_sum,     "article"),
+    "extract":   (_extract, "article"),
+    "classify":  (_class,   "record"),
+    "fused":     (_fused,   "article"),
+}
+
+
+class _Limiter:
+    """
+    Semáforo global + uno por etapa.  Se crea en cada ejecución porque
+    Streamlit lanza cada pipeline en un event loop nuevo (`asyncio.run`).
+    """
+    def __init__(self, concurrency: int | None = None,
+                 stage_limits: dict[str, int] | None = None):
+        limits = {**STAGE_CONCURRENCY, **(stage_limits or {})}
+        self.glob   = asyncio.Semaphore(max(1, concurrency or MAX_CONCURRENCY))
+        self.stages = {k: asyncio.Semaphore(max(1, v)) for k, v in limits.items()}
+
+    async def call(self, stage: str, fn, **kwargs):
+        # primero el de etapa: no acaparamos un hueco global mientras esperamos
+        async with self.stages[stage]:
+            async with self.glob:
+                return await fn(**kwargs)
+
+
+async def _close_run():
+    """
+    Cierra lo que la ejecución abrió en su event loop (navegador, clientes):
+    sus pools guardan referencias al loop y, si no, cada `asyncio.run` de
+    Streamlit dejaría vivos loop, clientes y sockets.
+    """
+    for close in (render.close, llm.aclose, http.aclose_all):
+        try:
+            await close()
+        except Exception as e:
+            log.warning("No se pudo cerrar %s: %s", close.__module__, e)
+
+
+def _closes_run(fn):
+    """Decora una entrada pública (corrutina o generador asíncrono) con `_close_run`."""
+    if inspect.isasyncgenfunction(fn):
+        @functools.wraps(fn)
+        async def gen(*args, **kwargs):
+            try:
+                async for event in fn(*args, **kwargs):
+                    yield event
+            finally:
+                await _close_run()
+        return gen
 
-     # fusionar y deduplicar por URL
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            await _close_run()
+    return wrapper
+
+
+async def _run_stage(stage: str, rec: dict, limiter: _Limiter,
+                     use_cache: bool = True) -> dict:
+    """Ejecuta una etapa consultando antes la caché persistente."""
+    agent, arg = _STAGES[stage]
+    if use_cache:
+        hit = stage_cache.get(rec["url"], stage, agent.stage_fingerprint)
+        if hit is not None:
+            rec.update(hit)
+            return rec
+    out = await limiter.call(stage, agent.run, **{arg: rec})
+    value = {f: out.get(f) for f in agent.stage_fields}
+    if use_cache and _storable(value, rec):
+        stage_cache.put(rec["url"], stage, agent.stage_fingerprint, value)
+    return out
+
+
+def _storable(value: dict, rec: dict) -> bool:
+    """
+    No se guardan resultados fallidos (JSON vacío, score N/D…) ni los
+    resúmenes hechos solo con el título porque la descarga falló: la próxima
+    ejecución debe volver a intentar con el artículo real.
+    """
+    if "text" in value:
+        text = (value["text"] or "").strip()
+        if not text or text == (rec.get("title") or "").strip():
+            return False
+    return all(v not in (None, "", {}, "N/D") for v in value.values())
+
+
+async def _classify_batched(recs: list[dict], limiter: _Limiter,
+                            use_cache: bool = True) -> list[dict]:
+    """Etapa classify por lotes (`ClassifyAgent.run_batch`), con la caché."""
+    fp = _class.batch_fingerprint
+    todo = []
+    for rec in recs:
+        hit = stage_cache.get(rec["url"], "classify", fp) if use_cache else None
+        if hit is not None:
+            rec.update(hit)
+        else:
+            todo.append(rec)
+    if todo:
+        # cada petición (lote o reintento individual) toma su hueco del limitador
+        await _class.run_batch(records=todo, call=functools.partial(limiter.call, "classify"))
+    for rec in todo if use_cache else ():
+        value = {f: rec.get(f) for f in _class.stage_fields}
+        if _storable(value, rec):
+            stage_cache.put(rec["url"], "classify", fp, value)
+    return recs
+
+
+async def _process_article(art: dict, limiter: _Limiter,
+                           on_stage=lambda stage, rec: None,
+                           use_cache: bool = True,
+                           mode: str = "agents",
+                           stages: tuple[str, ...] | None = None) -> dict:
+    """summarize → extract → classify (o fused) de un artículo, con límites."""
+    rec = art
+    for stage in stages or _MODES[mode]:
+        rec = await _run_stage(stage, rec, limiter, use_cache)
+        on_stage(stage, rec)
+    return rec
+
+
+async def _fetch_articles(keywords, n, date_from, date_to) -> list[dict]:
+    """Consulta NewsAPI + GNews en paralelo y deduplica por URL."""
+    raw_news, raw_gnews = await asyncio.gather(
+        _search.run(keywords=keywords, n=n,
+                    date_from=date_from, date_to=date_to),
+        _websearch.run(keywords=keywords, n=n,
+                       date_from=date_from, date_to=date_to)
+    )
     seen = set()
     raw = []
     for item in raw_news + raw_gnews:
-       if item["url"] not in seen:
-          raw.append(item)
-          seen.add(item["url"])
-
-    progress_cb("📝 Paso 2 · Resumiendo, extrayendo y clasificando…")
-    processed = []
-    for art in raw:
-        s  = await _sum.run(article=art)
-        e  = await _extract.run(article=s)
-        c  = await _class.run(record=e)
-        processed.append(c)
+        if item["url"] not in seen:
+            raw.append(item)
+            seen.add(item["url"])
+    return raw
+
+
+@_closes_run
+async def pipeline(keywords: str, n: int,
+                   date_from=None, date_to=None,
+                   question: str | None = None,
+                   progress_cb=lambda msg: None,
+                   concurrency: int | None = None,
+                   stage_limits: dict[str, int] | None = None,
+                   use_cache: bool = True,
+                   mode: str | None = None,
+                   classify_batch: bool | None = None):
+    """
+    Devuelve (records, map_html, answer).
+
+    `concurrency` limita las llamadas simultáneas en total y `stage_limits`
+    ({"summarize": 4, ...}) por etapa; si se omiten se usan los valores de
+    entorno.  Los artículos se procesan en paralelo pero conservan su orden;
+    si uno falla se registra en el log y se omite, sin abortar la ejecución.
+    Con `use_cache` las salidas ya calculadas (misma URL, prompt y modelo) se
+    leen de `stage_cache` en lugar de volver a llamar al LLM.
+    `mode` = "agents" (tres llamadas) o "fused" (una); por defecto PIPELINE_MODE.
+    Con `classify_batch` (por defecto CLASSIFY_BATCH) el modo "agents"
+    clasifica al final, muchos resúmenes por petición.
+    """
+    mode = mode or PIPELINE_MODE
+    batch = mode == "agents" and (CLASSIFY_BATCH if classify_batch is None
+                                  else classify_batch)
+    stages = ("summarize", "extract") if batch else None
+    limiter = _Limiter(concurrency, stage_limits)
+    try:                                 # la descarga ya puede abrir el navegador
+        progress_cb("🔍 Paso 1· Buscando artículos (NewsAPI + GNews)…")
+        raw = await _fetch_articles(keywords, n, date_from, date_to)
+
+        progress_cb("📝 Paso 2 · Resumiendo, extrayendo y clasificando…")
+        outs = await asyncio.gather(
+            *(_process_article(art, limiter, use_cache=use_cache, mode=mode,
+                               stages=stages)
+              for art in raw),
+            return_exceptions=True,
+        )
+        # un artículo que falla se omite; el resto del trabajo se conserva
+        processed = []
+        for art, out in zip(raw, outs):
+            if isinstance(out, BaseException):
+                log.warning("pipeline: falló '%s': %s", art.get("url"), out)
+            else:
+                processed.append(out)
+        if batch:
+            processed = await _classify_batched(processed, limiter, use_cache)
+    finally:
+        await render.close()             # navegador del plan B, si se abrió
 
     progress_cb("🗺️ Paso 3  · Geocodificando y generando mapa…")
     geo_out = await _geo.run(records=processed)
@@ -74,8 +265,196 @@ async def pipeline(keywords: str, n: int,
                                faiss_payloads=rag_out["faiss_payloads"])
     else:
         progress_cb("✅ Pipeline terminado.")
-    return geo_out["records"], geo_out["map_path"], answer
+    log.info("StageCache: %s", stage_cache.stats())
+    return geo_out["records"], geo_out["map_html"], answer
+
+
+@_closes_run
+async def pipeline_stream(keywords: str, n: int,
+                          date_from=None, date_to=None,
+                          question: str | None = None,
+                          progress_cb=lambda msg: None,
+                          concurrency: int | None = None,
+                          stage_limits: dict[str, int] | None = None,
+                          use_cache: bool = True,
+                          rag: dict | None = None,
+                          mode: str | None = None):
+    """
+    Variante en streaming de `pipeline`: generador asíncrono que emite eventos
+    en cuanto están listos, en orden de terminación:
+
+      {"type": "stage",  "stage": "summarize|extract|classify|fused",
+       "index": i, "record": rec}           ← actualización parcial
+      {"type": "record", "index": i, "record": rec}
+                                            ← registro geocodificado e indexado
+                                              (si el indexado falla se emite
+                                              igual y el error va al log)
+      {"type": "error",  "index": i, "error": exc}
+                                            ← el artículo falló y se omite
+      {"type": "done", "records": [...], "map_html": str,
+       "rag": {"faiss_index", "faiss_payloads"}, "answer": str | None}
+
+    `index` es la posición original del artículo; `records` del evento final
+    conserva ese orden.  Geocodificación e indexado RAG se hacen registro a
+    registro, no como lote al final.  Si se pasa `rag` (p. ej. el índice
+    cargado de disco) los registros nuevos se añaden a ese índice.  `mode`
+    como en `pipeline`.
+    """
+    mode = mode or PIPELINE_MODE
+    limiter  = _Limiter(concurrency, stage_limits)
+    queue: asyncio.Queue = asyncio.Queue()
+    rag      = {"faiss_index":    (rag or {}).get("faiss_index"),
+                "faiss_payloads": (rag or {}).get("faiss_payloads")}
+    rag_lock = asyncio.Lock()            # FAISS no admite altas concurrentes
+    geocoding: dict = {}                 # Nominatim en curso, compartido por la ejecución
+
+    async def _one(i: int, art: dict):
+        def on_stage(stage, rec):
+            queue.put_nowait({"type": "stage", "stage": stage,
+                              "index": i, "record": rec})
+        try:
+            rec = await _process_article(art, limiter, on_stage, use_cache, mode)
+            await _geo.locate(rec, geocoding)
+        except Exception as e:
+            log.warning("pipeline_stream: falló '%s': %s", art.get("url"), e)
+            queue.put_nowait({"type": "error", "index": i, "error": e})
+            return
+        try:
+            async with rag_lock:
+                out = await _rag.run(records=[rec], **rag)
+                rag.update(faiss_index=out["faiss_index"],
+                           faiss_payloads=out["faiss_payloads"])
+        except Exception as e:
+            # el registro ya está procesado: va a la tabla y al mapa igualmente
+            log.warning("pipeline_stream: no se pudo indexar '%s': %s", art.get("url"), e)
+        done[i] = rec
+        queue.put_nowait({"type": "record", "index": i, "record": rec})
+
+    done: dict[int, dict] = {}
+    tasks: list[asyncio.Task] = []
+    try:
+        progress_cb("🔍 Paso 1· Buscando artículos (NewsAPI + GNews)…")
+        raw = await _fetch_articles(keywords, n, date_from, date_to)
+
+        progress_cb("📝 Paso 2 · Procesando artículos en paralelo…")
+        tasks = [asyncio.create_task(_one(i, art)) for i, art in enumerate(raw)]
+        pending = len(tasks)
+        while pending:
+            event = await queue.get()
+            if event["type"] in ("record", "error"):
+                pending -= 1
+            yield event
+    finally:
+        for t in tasks:
+            t.cancel()
+        await render.close()
+
+    records = [done[i] for i in sorted(done)]
+    progress_cb("🗺️ Paso 3  · Generando mapa…")
+    map_html = _geo.build_map(records)
+
+    answer = None
+    if question and rag["faiss_index"] is not None:
+        progress_cb("💬 Paso 4  · Contestando tu pregunta…")
+        answer = await _qa.run(question=question, **rag)
+    else:
+        progress_cb("✅ Pipeline terminado.")
+    log.info("StageCache: %s", stage_cache.stats())
+    yield {"type": "done", "records": records, "map_html": map_html,
+           "rag": rag, "answer": answer}
+
+
+@_closes_run
+async def batch_pipeline(keywords: str, n: int,
+                         date_from=None, date_to=None,
+                         job: str | None = None,
+                         stages: tuple[str, ...] = ("summarize", "extract", "classify"),
+                         embed: bool = True,
+                         progress_cb=lambda msg: None,
+                         use_cache: bool = True,
+                         rag: dict | None = None):
+    """
+    Variante offline para cargas históricas: las etapas LLM y los embeddings
+    van por la Batch API (`agents.batch`) en lugar de peticiones interactivas.
+    Tarda minutos u horas, pero es más barata y no choca con límites de ritmo.
+
+    `job` nombra el trabajo (por defecto, huella de la búsqueda): volver a
+    llamar con el mismo nombre tras una interrupción retoma los mismos
+    artículos y los lotes ya enviados.  Un trabajo que ya terminó no se
+    retoma: la misma búsqueda otro día vuelve a consultar las noticias.
+    Devuelve (records, map_html, rag).
+    """
+    job = job or fingerprint(keywords, n, date_from, date_to)
+    runner = BatchRunner(job, progress_cb=progress_cb)
+    if runner.completed():
+        runner.reset()
+    records = runner.load_records()
+    if records is None:
+        progress_cb("🔍 Paso 1· Buscando y descargando artículos…")
+        records = await _fetch_articles(keywords, n, date_from, date_to)
+        need = [r for r in records if not r.get("text") and not r.get("fetch_failed")]
+        try:
+            texts = await fetch_articles([r["url"] for r in need])
+        finally:
+            await render.close()
+        for rec, text in zip(need, texts):
+            rec["text"] = text
+        for rec in records:              # descarga fallida: se resume el título
+            rec["text"] = rec.get("text") or rec["title"]
+        runner.save_records(records)
+
+    limiter = _Limiter()                 # para lo que vaya por la vía interactiva
+    for stage in stages:
+        agent = _STAGES[stage][0]
+        todo = []
+        for rec in records:
+            hit = (stage_cache.get(rec["url"], stage, agent.stage_fingerprint)
+                   if use_cache else None)
+            if hit is not None:
+                rec.update(hit)
+            else:
+                todo.append(rec)
+        progress_cb(f"📦 Lote · {stage}: {len(todo)} peticiones…")
+        await runner.run_chat(stage, agent, todo,
+                              call=functools.partial(limiter.call, stage))
+        for rec in todo if use_cache else ():
+            value = {f: rec.get(f) for f in agent.stage_fields}
+            if _storable(value, rec):
+                stage_cache.put(rec["url"], stage, agent.stage_fingerprint, value)
+
+    if embed:
+        progress_cb("📦 Lote · embeddings…")
+        await runner.run_embeddings([r.get("summary") or "" for r in records])
+
+    progress_cb("🗺️ Paso 3  · Geocodificando y generando mapa…")
+    geo_out = await _geo.run(records=records)
+    progress_cb("📚 Paso 4 · Indexando en el RAG…")
+    rag_out = await _rag.run(records=geo_out["records"], **(rag or {}))
+    runner.mark_completed()
+    log.info("StageCache: %s", stage_cache.stats())
+    return geo_out["records"], geo_out["map_html"], rag_out
 
+
+def load_index(mmap: bool = True) -> dict | None:
+    """Índice RAG persistido ({"faiss_index", "faiss_payloads"}) o None."""
+    return index_store.load(mmap=mmap)
+
+
+def save_index(rag: dict) -> str:
+    """Guarda el índice RAG como nueva versión en disco."""
+    return index_store.save(rag["faiss_index"], rag["faiss_payloads"])
+
+
+@_closes_run
 async def add_database(df, rag):
     return await _db.run(df=df, faiss_index=rag["faiss_index"],
                               faiss_payloads=rag["faiss_payloads"])
+
+
+@_closes_run
+async def ask(question: str, rag: dict, history: list | None = None):
+    """Pregunta al asistente RAG; devuelve (respuesta, historial)."""
+    return await rag_builder.query(question=question,
+                                   faiss_index=rag["faiss_index"],
+                                   faiss_payloads=rag["faiss_payloads"],
+                                   history=history or [])
@@ -0,0 +1,65 @@
+# tests/test_index_store.py
+"""Ida y vuelta de IndexStore: versiones sucesivas, poda y recarga mapeada."""
+import numpy as np
+import pytest
+from agents.index_manager import migrate, new_index
+from agents.index_store import IndexStore, ensure_writable
+
+
+def _vecs(n, d=16, seed=0):
+    v = np.random.default_rng(seed).standard_normal((n, d)).astype("float32")
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def test_tres_guardados_sobre_el_indice_cargado(tmp_path):
+    store = IndexStore(tmp_path, keep=2)
+    index = new_index(16)
+    index.add(_vecs(4))
+    store.save(index, [f"doc {i}" for i in range(4)])
+
+    for round_ in range(1, 4):          # el tercero poda la versión de origen
+        rag = store.load()
+        index = ensure_writable(rag["faiss_index"])
+        index.add(_vecs(2, seed=round_))
+        rag["faiss_payloads"].extend([f"nuevo {round_}.{j}" for j in range(2)])
+        store.save(index, rag["faiss_payloads"])
+
+    rag = store.load()
+    assert rag["faiss_index"].ntotal == 10
+    assert len(rag["faiss_payloads"]) == 10
+    assert rag["faiss_payloads"][0] == "doc 0"
+    assert rag["faiss_payloads"][-1] == "nuevo 3.1"
+    assert len(list(tmp_path.glob("v[0-9]*"))) == 2
+
+
+def test_guardar_dos_veces_el_mismo_payload_store(tmp_path):
+    store = IndexStore(tmp_path, keep=1)
+    index = new_index(16)
+    index.add(_vecs(3))
+    store.save(index, ["a", "b", "c"])
+
+    rag = store.load()
+    payloads = rag["faiss_payloads"]
+    payloads.append("d")
+    store.save(ensure_writable(rag["faiss_index"]), payloads)
+    payloads.append("e")                # sigue vivo tras podar su versión
+    store.save(ensure_writable(rag["faiss_index"]), payloads)
+
+    assert list(store.load()["faiss_payloads"]) == ["a", "b", "c", "d", "e"]
+
+
+@pytest.mark.parametrize("kind", ["hnsw", "ivf"])
+def test_indice_ann_migrado_se_guarda_y_recarga(tmp_path, kind):
+    vecs = _vecs(2000)
+    flat = new_index(16)
+    flat.add(vecs)
+    index = migrate(flat, kind)
+    store = IndexStore(tmp_path)
+    store.save(index, [str(i) for i in range(len(vecs))])
+
+    rag = store.load()
+    loaded = rag["faiss_index"]
+    assert loaded.ntotal == 2000
+    _, I = loaded.search(vecs[:5], 1)
+    assert list(I[:, 0]) == [0, 1, 2, 3, 4]
+    assert rag["faiss_payloads"][int(I[4, 0])] == "4"
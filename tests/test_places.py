@@ -0,0 +1,40 @@
+# tests/test_places.py
+"""Regresiones de PlaceResolver contra el gazetteer incluido."""
+import pytest
+from agents.places import get_resolver
+
+
+@pytest.fixture(scope="module")
+def resolver():
+    return get_resolver()
+
+
+def test_ciudad_de_mexico_no_es_el_estado_de_mexico(resolver):
+    hit = resolver.resolve("Ciudad de México")
+    assert hit is not None
+    assert (hit.place.tipo, hit.place.nombre) == ("estado", "Ciudad de México")
+
+
+def test_alcaldia_de_cdmx_con_pais_delante(resolver):
+    hit = resolver.resolve("México, Ciudad de México, Iztapalapa")
+    assert hit is not None
+    assert (hit.place.nombre, hit.place.estado) == ("Iztapalapa", "Ciudad de México")
+
+
+def test_guerrero_negro_no_es_el_estado_de_guerrero(resolver):
+    # localidad de Mulegé: no está en el gazetteer y se deja a Nominatim
+    assert resolver.resolve("Guerrero Negro") is None
+    assert resolver.resolve("México, Baja California Sur, Guerrero Negro") is None
+
+
+@pytest.mark.parametrize("lugar", ["Córdoba, Argentina", "Valladolid, España",
+                                   "Mérida, Venezuela", "Victoria, Australia",
+                                   "Estados Unidos, Texas, Victoria"])
+def test_homonimos_extranjeros_no_se_resuelven(resolver, lugar):
+    assert resolver.resolve(lugar) is None
+
+
+def test_municipio_suelto_no_queda_anclado_a_mexico(resolver):
+    assert resolver.resolve("Mérida").anchored is False
+    hit = resolver.resolve("México, N/D, Mérida")
+    assert (hit.place.estado, hit.anchored) == ("Yucatán", True)